@@ -4,16 +4,36 @@
 import re
 import os
 import sys
+import gzip
+import signal
 import csv
 import time
+import numpy as np
 import pandas as pd
+import heapq
 import webbrowser
+import base64
+import sqlite3
+import cPickle
+import urllib
+import multiprocessing
 
 from optparse import OptionParser
-from collections import OrderedDict
+from itertools import islice, chain
+from cStringIO import StringIO
+from collections import Counter, OrderedDict, deque, namedtuple
 from functools import wraps
+from sketch import QuantileSketch
+from sinks import CsvSink, SINKS, load_report, iter_report, report_type
+try:
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+except ImportError:
+    plt = None
 
-Commands = ("build", "read")
+Commands = ("build", "read", "follow", "plot", "query", "stall", "waits")
 
 USAGE = """
 %prog <command> [options]
@@ -31,286 +51,2239 @@ def timing(f, *args, **kwargs):
         return r
     return deco
 
+class TimestampDecoder(object):
+    """
+    TimestampDecoder decodes the [%(asctime)s ...] timestamp of the trace
+    lines, e.g. "2015-04-14 10:02:03,123", into epoch seconds.
+    The epoch of every second is cached, a timestamp of a cached second
+    only costs the milliseconds offset.
+    @fmt: the strptime format of the timestamp without milliseconds
+    @cache_size: the max number of cached seconds
+    """
+    def __init__(self, fmt="%Y-%m-%d %H:%M:%S", cache_size=4096):
+        super(TimestampDecoder, self).__init__()
+        self._fmt = fmt
+        self._width = len(time.strftime(fmt, time.localtime(0)))
+        self._cache_size = cache_size
+        self._cache = {}
+        self._seconds = {}
+
+    def _epoch(self, second):
+        epoch = self._cache.get(second)
+        if epoch is None:
+            if len(self._cache) >= self._cache_size:
+                self._cache.clear()
+            epoch = self._cache[second] = \
+                time.mktime(time.strptime(second, self._fmt))
+        return epoch
+
+    def decode(self, ts):
+        """
+        "2015-04-14 10:02:03,123" -> 1428976923.123
+        """
+        w = self._width
+        second = ts[:w]
+        epoch = self._cache.get(second)
+        if epoch is None:
+            epoch = self._epoch(second)
+        return epoch + int(ts[w + 1:]) / 1000.0
+
+    def encode(self, epoch):
+        """
+        1428976923.123 -> "2015-04-14 10:02:03,123", the timestamp of the
+        corrected epoch of an event
+        """
+        second, ms = divmod(int(round(epoch * 1000)), 1000)
+        text = self._seconds.get(second)
+        if text is None:
+            if len(self._seconds) >= self._cache_size:
+                self._seconds.clear()
+            text = self._seconds[second] = \
+                time.strftime(self._fmt, time.localtime(second))
+        return "{},{:03d}".format(text, ms)
+
+    def decode_many(self, values):
+        """
+        The vectorized decode for a column of timestamps, e.g. a column
+        of a report DataFrame. Returns a float64 array, the missing
+        timestamps are decoded as NaN.
+        """
+        w = self._width
+        values = np.asarray(values, dtype=object)
+        out = np.empty(len(values), dtype=np.float64)
+        out.fill(np.nan)
+        mask = np.array([isinstance(v, basestring) for v in values], dtype=bool)
+        if not mask.any():
+            return out
+        ts = values[mask].astype('S%d' % (w + 4))
+        seconds, idx = np.unique(ts.astype('S%d' % w), return_inverse=True)
+        epochs = np.array([self._epoch(x) for x in seconds], dtype=np.float64)
+        digits = ts.view(np.uint8).reshape(len(ts), w + 4)[:, w + 1:]
+        ms = ((digits.astype(np.int64) - 48) * np.array([100, 10, 1])).sum(axis=1)
+        out[mask] = epochs[idx] + ms / 1000.0
+        return out
+
+
+decoder = TimestampDecoder()
+
+
+# node: the node of the log merged from many nodes, None of one log
+TraceEvent = namedtuple('TraceEvent', ('kind', 'ts', 'epoch', 'pid',
+                                       'task_id', 'task_name', 'queue',
+                                       'retries', 'value', 'node'))
+
+
+def _task_fields(line):
+    """
+    The values of the {task_id:xxx, task_name:xxx, ...} dict which
+    ends a trace line, in the logged order
+    """
+    b = line.index('{task_id:')
+    e = line.index('}', b)
+    return [f[f.index(':') + 1:] for f in line[b + 1:e].split(', ')]
+
+
+def _task_event(kind, line, retries=0, value=None):
+    fields = _task_fields(line)
+    task_id, name = fields[0], fields[1]
+    if retries is None and len(fields) > 2:
+        retries = fields[2]
+    # Consumer-xxx, Worker-xxx, app-xxx
+    b = line.index('anan: ') + 6
+    pid = line[line.index('-', b) + 1:line.index(' ', b)].rstrip(':')
+    ts = line[1:24]
+    return TraceEvent(kind, ts, decoder.decode(ts), pid, task_id,
+                      name.split('.')[-1], name.split('.')[0],
+                      retries, value, None)
+
+
+def _extract_publish(kind, line):
+    return _task_event(kind, line, retries=None)
+
+
+def _extract_received(kind, line):
+    return _task_event(kind, line)
+
+
+def _extract_send(kind, line):
+    """
+    app.send_task logs the task_id, Task.apply_async only logs the
+    task name, its task_id is left None and the send is joined to the
+    next publishing of the same pid.
+    """
+    if '{task_id:' in line:
+        return _task_event(kind, line)
+    b = line.index('anan: ') + 6
+    pid = line[line.index('-', b) + 1:line.index(' ', b)]
+    name = line[line.index('task:', b) + 5:].rstrip('\n')
+    ts = line[1:24]
+    return TraceEvent(kind, ts, decoder.decode(ts), pid, None,
+                      name.split('.')[-1], name.split('.')[0], 0, None, None)
+
+
+def _extract_spends(kind, line):
+    b = line.index(' spends ') + 8
+    return _task_event(kind, line, retries=None,
+                       value=line[b:line.index(' ', b)])
+
+
+# the prefix of the fixed field records
+RECORD_PREFIX = 'anan| '
+
+
+def _unescape(field):
+    """
+    The value of a field of a fixed field record, the space, the line
+    breaks and % of a value are %-escaped, see billiard.anan
+    """
+    return urllib.unquote(field) if '%' in field else field
+
+
+def _record_event(line, b, kinds=None):
+    """
+    The TraceEvent of the fixed field record logged by the patched
+    modules with ANAN_TRACE=record from b, the fields are split once:
+    "anan| kind pid task_id task_name retries value", - is missing
+    """
+    kind, pid, task_id, name, retries, value = \
+        line[b:].rstrip('\n').split(' ')
+    if kinds is not None and kind not in kinds:
+        return None
+    ts = line[1:24]
+    task_id = None if task_id == '-' else task_id
+    retries = 0 if retries == '-' else retries
+    value = None if value == '-' else value
+    if '%' in line:
+        task_id = task_id and _unescape(task_id)
+        name = _unescape(name)
+        retries = retries and _unescape(retries)
+        value = value and _unescape(value)
+    # the same values as the extractors of the messages
+    return TraceEvent(kind, ts, decoder.decode(ts), pid, task_id,
+                      name.rpartition('.')[2], name.partition('.')[0],
+                      retries, value, None)
+
+
+def _line_task_id(line):
+    """
+    The task_id of a trace line without parsing it, None if it has none
+    """
+    b = line.find('{task_id:')
+    if b >= 0:
+        return line[b + 9:line.find(',', b)]
+    b = line.find(RECORD_PREFIX)
+    if b >= 0:
+        fields = line[b:].split(' ', 4)
+        if len(fields) > 3 and fields[3] != '-':
+            return _unescape(fields[3])
+    return None
+
+
+class TraceClassifier(object):
+    """
+    TraceClassifier classifies the "anan:" trace lines written by the
+    patched celery/billiard modules into TraceEvent.
+    Every event kind is registered with a literal marker, a line is
+    handed to the extractor of the first marker it contains, so a line
+    is only parsed once and only by the extractor of its kind.
+    The fixed field records of ANAN_TRACE=record are split into the
+    TraceEvent without any marker, see _record_event.
+    @prefix: the literal all the trace lines contain
+    """
+    def __init__(self, prefix='anan: '):
+        super(TraceClassifier, self).__init__()
+        self._prefix = prefix
+        self._rules = []
+
+    @property
+    def kinds(self):
+        return [kind for kind, _, _ in self._rules]
+
+    def register(self, kind, marker, extractor):
+        """
+        Register an event kind, the markers are tried in the register
+        order, so register the more specific marker first.
+        @kind: the event kind name
+        @marker: the literal only the lines of this kind contain
+        @extractor: extractor(kind, line) returns the TraceEvent
+        """
+        self._rules.append((kind, marker, extractor))
+
+    def classify(self, line, kinds=None):
+        """
+        Return the TraceEvent of the line, None if the line is not a
+        trace line or its kind is not in kinds.
+        """
+        if self._prefix not in line:
+            b = line.find(RECORD_PREFIX)
+            return _record_event(line, b + len(RECORD_PREFIX), kinds) \
+                if b >= 0 else None
+        for kind, marker, extractor in self._rules:
+            if marker in line:
+                if kinds is not None and kind not in kinds:
+                    return None
+                return extractor(kind, line)
+        return None
+
+    def events(self, lines, kinds=None):
+        classify = self.classify
+        for l in lines:
+            ev = classify(l, kinds)
+            if ev is not None:
+                yield ev
+
+
+classifier = TraceClassifier()
+classifier.register('publish', 'publishing', _extract_publish)
+classifier.register('received', 'Received', _extract_received)
+classifier.register('accepted', 'task-accepted', _extract_received)
+classifier.register('start', 'starts executing', _extract_publish)
+classifier.register('end', 'spends', _extract_spends)
+classifier.register('retry', 'starts sending Retry', _extract_publish)
+classifier.register('send', 'starts sending task', _extract_send)
+classifier.register('got', 'got task from broker', _extract_received)
+classifier.register('apply', 'Apply Task', _extract_publish)
+classifier.register('done', 'notifies main process done', _extract_publish)
+
+
+def _task_id_of(key):
+    """
+    The task_id of a pending record key, an attempt of the task still
+    in flight after its retry is pending by task_id#retries
+    """
+    return key.partition('#')[0]
+
+
+class PendingTable(OrderedDict):
+    """
+    PendingTable is the task_id -> record table of the uncompleted
+    records, bounded by max_size records and by ttl seconds of the log
+    time. The evicted records are handed to spill(reason, record).
+    @max_size: the max number of records, None for no limit
+    @ttl: the max seconds a record waits for its partner lines
+    @ts_fields: the timestamp fields of the record, the earliest one
+                is when the record was born
+    @spill: called with every evicted record
+    """
+    def __init__(self, max_size=None, ttl=None, ts_fields=(), spill=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.ts_fields = ts_fields
+        self.spill = spill
+        super(PendingTable, self).__init__()
+
+    def __setitem__(self, key, value):
+        super(PendingTable, self).__setitem__(key, value)
+        if self.max_size and len(self) > self.max_size:
+            _, record = self.popitem(last=False)
+            if self.spill:
+                self.spill('evicted', record)
+
+    def __reduce__(self):
+        # pickled as a plain OrderedDict, the bounds belong to the analyzer
+        return (OrderedDict, (self.items(),))
+
+    def born(self, record):
+        """
+        The earliest timestamp of the record, None if it has none, the
+        records of some builders only have some of the ts_fields
+        """
+        stamps = [decoder.decode(record[f]) for f in self.ts_fields
+                  if record.get(f)]
+        return min(stamps) if stamps else None
+
+    def expire(self, now):
+        """
+        Evict the records born ttl seconds before now, the records
+        are in the order they were born. A record without a timestamp
+        can not age, it is only bounded by max_size.
+        """
+        if not self.ttl:
+            return
+        deadline = now - self.ttl
+        expired = []
+        for key, record in self.iteritems():
+            born = self.born(record)
+            if born is None:
+                continue
+            if born > deadline:
+                break
+            expired.append(key)
+        for key in expired:
+            record = self.pop(key)
+            if self.spill:
+                self.spill('expired', record)
+
+
+# the waits of a task in the consumer and the pool before it executes
+CONSUMER_WAITS = ('dispatch', 'reserved', 'pipe', 'ack')
+# the percentiles of the report columns
+PERCENTILES = (0.5, 0.9, 0.99)
+# the columns the percentiles are grouped by
+PERCENTILE_GROUPS = ('task_name', 'queue')
+
+
+def value_columns(df):
+    """
+    The seconds columns of a report: duration of the worker report,
+    duration(in queue) and latency of the queue report and the stages
+    of the lifecycle report. They are the float columns except the
+    timestamps read as NaN when they are all missing.
+    """
+    timestamps = set(f for b in Analyzer._builders.values() for f in b.ts_fields)
+    return [c for c in df.columns
+            if df[c].dtype.kind == 'f' and c not in timestamps]
+
+
+def _percentile_frame(rows):
+    """
+    rows: [(column, group, count, [quantiles of PERCENTILES], max)]
+    """
+    names = ['p{:g}'.format(q * 100) for q in PERCENTILES]
+    data = [[c, g, n] + list(qs) + [m] for c, g, n, qs, m in rows]
+    df = pd.DataFrame(data, columns=['column', 'group', 'count'] + names + ['max'])
+    return df.set_index(['column', 'group'])
+
+
+def percentiles(df, by, columns=None):
+    """
+    The exact percentiles of the columns of the report grouped by, the
+    value_columns by default
+    """
+    rows = []
+    for c in [c for c in columns or value_columns(df) if c in df]:
+        for g, values in df.groupby(by)[c]:
+            values = values.dropna()
+            if len(values):
+                rows.append((c, g, len(values),
+                             np.percentile(values, [q * 100 for q in PERCENTILES]),
+                             values.max()))
+    return _percentile_frame(rows)
+
+
+def amplification(frames):
+    """
+    The retry amplification of every task_name of the retry report, the
+    attempts executed for every task, the frames may be the chunks of
+    a report iterated.
+    """
+    total = None
+    for df in frames:
+        df = pd.DataFrame({'task_name': df.task_name,
+                           'tasks': 1,
+                           'retried': (df.retries > 0).astype(int),
+                           'attempts': df.retries + 1,
+                           'retry_lost': df.retry_lost.fillna(0)})
+        df = df.groupby('task_name').sum()
+        total = df if total is None else total.add(df, fill_value=0)
+    if total is None:
+        return pd.DataFrame()
+    total['amplification'] = total.attempts / total.tasks
+    total['retry_lost'] = total.retry_lost / total.tasks
+    return total[['tasks', 'retried', 'attempts', 'amplification', 'retry_lost']]
+
+
+def _occupancy(begins, ends, edges):
+    """
+    The integral of the number of the intervals [begin, end) open from
+    edges[0] to every edge, the mean number of the open intervals in a
+    bucket is the difference of its edges by the width of the bucket.
+    """
+    origin = edges[0]
+    total = np.zeros(len(edges))
+    for sign, points in ((1, begins), (-1, ends)):
+        points = np.sort(points - origin)
+        cum = np.concatenate(([0.0], np.cumsum(points)))
+        k = np.searchsorted(points, edges - origin, 'right')
+        total += sign * ((edges - origin) * k - cum[k])
+    return total
+
+
+def _pid_of(value):
+    """
+    The pid of a report value as a string, None if it is missing, the
+    pid column with missing values is read as float
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, float):
+        return None if np.isnan(value) else '%d' % value
+    return str(value)
+
+
+def _worker_of(pid):
+    # the pid of the node logs is node/pid
+    return pid.rpartition('/')[0] or 'worker'
+
+
+def _workers_of(df):
+    """
+    The worker of every row of the pool report: the consumer pid which
+    applies the attempts of its pool process, most of them if several,
+    the node of the pool process if none is applied in the report.
+    """
+    pids = [_pid_of(p) for p in df.pid]
+    consumers = [_pid_of(c) for c in df.consumer] if 'consumer' in df \
+        else [None] * len(pids)
+    owner = {}
+    for (pid, consumer), _ in Counter((p, c) for p, c in zip(pids, consumers)
+                                      if c is not None).most_common():
+        owner.setdefault(pid, consumer)
+    return [owner.get(p) or _worker_of(p) for p in pids]
+
+
+def _overlap(idle, waiting, edges, min_idle=1, min_waiting=1):
+    """
+    The seconds of every bucket during which at least min_waiting tasks
+    wait and at least min_idle processes are idle at the same moment.
+    idle, waiting: [(begins, ends, sign)], the intervals [begin, end)
+    add sign to the count
+    """
+    times, didle, dwait = [], [], []
+    for intervals, is_idle in ((idle, True), (waiting, False)):
+        for begins, ends, sign in intervals:
+            for points, d in ((begins, sign), (ends, -sign)):
+                times.append(points)
+                delta = np.full(len(points), d, dtype=np.int64)
+                zero = np.zeros(len(points), dtype=np.int64)
+                didle.append(delta if is_idle else zero)
+                dwait.append(zero if is_idle else delta)
+    times = np.concatenate(times)
+    if not len(times):
+        return np.zeros(len(edges) - 1)
+    order = np.argsort(times, kind='mergesort')
+    times = times[order]
+    idle = np.cumsum(np.concatenate(didle)[order])
+    waiting = np.cumsum(np.concatenate(dwait)[order])
+    # the counts after all the changes at the same time
+    last = np.append(times[1:] != times[:-1], True)
+    times, idle, waiting = times[last], idle[last], waiting[last]
+    both = (idle[:-1] >= min_idle) & (waiting[:-1] >= min_waiting)
+    return np.diff(_occupancy(times[:-1][both], times[1:][both], edges))
+
+
+def pool_timeline(df, bucket=1.0, min_waiting=1, min_idle=1, min_stall=0.5):
+    """
+    Rebuild the busy intervals(start -> end) of every pool process from
+    the pool report, a process is alive from its first start to its last
+    end and belongs to the worker of the consumer applying its tasks.
+    Every bucket of every worker has the mean number of the alive
+    processes(procs), the busy and the idle ones, and of the tasks
+    waiting in the consumer(reserved) and in the pool(queued).
+    A retry waits for its countdown in the consumer, so only its pool
+    wait is counted. The stalled seconds of a bucket are the seconds
+    at least min_waiting tasks wait while at least min_idle processes
+    of the same worker are idle, the bucket stalls if they are at least
+    min_stall of the bucket.
+    Returns (the timeline of the buckets, the utilization of the processes)
+    """
+    df = df.assign(worker=_workers_of(df))
+    t = dict((c, decoder.decode_many(df[c].values))
+             for c in ('received', 'apply', 'start', 'end'))
+    t['received'][df.retries.values > 0] = np.nan
+    begin = np.nanmin(t['start']) // bucket * bucket
+    edges = np.arange(begin, np.nanmax(t['end']) + bucket, bucket)
+    frames = []
+    procs = []
+    for worker, rows in df.groupby('worker').indices.items():
+        w = dict((c, v[rows]) for c, v in t.items())
+        ran = ~np.isnan(w['start']) & ~np.isnan(w['end'])
+        alive = pd.DataFrame({'pid': df.pid.values[rows][ran],
+                              'start': w['start'][ran], 'end': w['end'][ran],
+                              'busy': w['end'][ran] - w['start'][ran]})
+        g = alive.groupby('pid')
+        alive = pd.DataFrame({'first': g.start.min(), 'last': g.end.max(),
+                              'tasks': g.busy.count(), 'busy': g.busy.sum()},
+                             columns=['first', 'last', 'tasks', 'busy'])
+        alive['utilization'] = alive.busy / (alive['last'] - alive['first'])
+        alive.insert(0, 'worker', worker)
+        procs.append(alive)
+        intervals = OrderedDict()
+        for c, (b, e) in (('procs', (alive['first'].values, alive['last'].values)),
+                          ('busy', (w['start'][ran], w['end'][ran])),
+                          ('reserved', (w['received'], w['apply'])),
+                          ('queued', (w['apply'], w['start']))):
+            keep = ~np.isnan(b) & ~np.isnan(e)
+            intervals[c] = (b[keep], e[keep])
+        frame = pd.DataFrame(index=pd.to_datetime(edges[:-1], unit='s'))
+        for c, (b, e) in intervals.items():
+            frame[c] = np.diff(_occupancy(b, e, edges)) / bucket
+        frame['idle'] = frame.procs - frame.busy
+        frame['waiting'] = frame.reserved + frame.queued
+        frame['utilization'] = frame.busy / frame.procs
+        frame['stalled'] = _overlap(
+            [intervals['procs'] + (1,), intervals['busy'] + (-1,)],
+            [intervals['reserved'] + (1,), intervals['queued'] + (1,)],
+            edges, min_idle, min_waiting)
+        frame['stall'] = frame.stalled >= min_stall * bucket
+        frame.insert(0, 'worker', worker)
+        frame.index.name = 'time'
+        frames.append(frame)
+    return pd.concat(frames), pd.concat(procs)
+
+
+def consumer_waits(df, bucket=60.0):
+    """
+    The waits of the consumer report by consumer pid: the tasks, the
+    mean and the p90 of every wait and the wait the tasks spend the most
+    in, e.g. reserved for the prefetch hoarding and pipe for the pool
+    pipe backlog, and by pid and every bucket seconds of the received.
+    Returns (the waits by pid, the waits by bucket and pid)
+    """
+    g = df.groupby('pid')
+    mean = g[list(CONSUMER_WAITS)].mean()
+    p90 = g[list(CONSUMER_WAITS)].quantile(0.9)
+    p90.columns = ['{} p90'.format(w) for w in CONSUMER_WAITS]
+    by_pid = pd.concat([g.size().rename('tasks'), mean, p90], axis=1)
+    by_pid['most'] = mean.idxmax(axis=1)
+    epochs = decoder.decode_many(df.received.values)
+    for h in ('got', 'apply'):
+        missing = np.isnan(epochs)
+        epochs[missing] = decoder.decode_many(df[h].values[missing])
+    df = df.assign(time=pd.to_datetime(epochs // bucket * bucket, unit='s'))
+    g = df.groupby(['time', 'pid'])
+    by_bucket = pd.concat([g.size().rename('tasks'),
+                           g[list(CONSUMER_WAITS)].mean()], axis=1)
+    return by_pid, by_bucket
+
+
+def stall_windows(timeline, bucket=1.0):
+    """
+    Merge the consecutive stalled buckets of every worker of the
+    pool_timeline into the stall windows, the longest first.
+    """
+    windows = []
+    for worker, frame in timeline.groupby('worker'):
+        run = (frame.stall != frame.stall.shift()).cumsum()
+        for _, w in frame[frame.stall].groupby(run[frame.stall]):
+            windows.append((worker, w.index[0],
+                            w.index[-1] + pd.Timedelta(seconds=bucket),
+                            len(w) * bucket, w.stalled.sum(), w.waiting.mean(),
+                            w.idle.mean(), w.utilization.mean()))
+    windows = pd.DataFrame(windows, columns=['worker', 'begin', 'end', 'seconds',
+                                             'stalled', 'waiting', 'idle',
+                                             'utilization'])
+    return windows.sort_values('seconds', ascending=False)
+
+
+def sketch_percentiles(path, by=PERCENTILE_GROUPS, columns=None,
+                       accuracy=0.01):
+    """
+    The percentiles of the columns of the report grouped by each of by
+    in one pass, every chunk of the report is counted into the
+    QuantileSketch of its (by, group, column), so the memory is bounded
+    by the number of the groups instead of the rows.
+    Returns {by: percentiles}
+    """
+    sketches = OrderedDict((b, {}) for b in by)
+    for df in iter_report(path):
+        for b in by:
+            for c in [c for c in columns or value_columns(df) if c in df]:
+                for g, values in df.groupby(b)[c]:
+                    s = sketches[b].get((c, g))
+                    if s is None:
+                        s = sketches[b][(c, g)] = QuantileSketch(accuracy)
+                    s.add_many(values.values)
+    return OrderedDict((b, _percentile_frame(
+        [(c, g, s.count, [s.quantile(q) for q in PERCENTILES], s.max)
+         for (c, g), s in sorted(sketches[b].items()) if s.count]))
+        for b in by)
+
+
+def minmax_downsample(x, y, buckets):
+    """
+    Reduce the series to the min and the max point of every one of the
+    buckets, the peaks and the first and last points of the series are
+    kept. The NaN points are dropped.
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    keep = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[keep], y[keep]
+    if len(x) <= 2 * buckets:
+        return x, y
+    idx = [0]
+    for b in np.array_split(np.arange(len(y)), buckets):
+        idx.extend((b[np.argmin(y[b])], b[np.argmax(y[b])]))
+    idx = np.unique(idx + [len(x) - 1])
+    return x[idx], y[idx]
+
+
+def lttb(x, y, threshold):
+    """
+    Reduce the series to threshold points by Largest-Triangle-Three-
+    Buckets, the point of every bucket forms the largest triangle with
+    the point selected of the previous bucket and the average of the
+    next one, so the shape of the series is kept. The NaN points are
+    dropped.
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    keep = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[keep], y[keep]
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+    every = (n - 2) / float(threshold - 2)
+    idx = np.empty(threshold, dtype=int)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in xrange(threshold - 2):
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) -
+                      (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        idx[i + 1] = a
+    return x[idx], y[idx]
+
+
+# the downsampler name -> (x, y, points) -> x, y
+DOWNSAMPLERS = {'lttb': lttb,
+                'minmax': lambda x, y, points: minmax_downsample(x, y, points // 2)}
+
+
+def throughput(epochs, groups, max_bins):
+    """
+    Count the rows by the interval of their timestamps and the groups,
+    the interval is a number of minutes so there are at most max_bins
+    intervals. Returns a DataFrame of the interval start x groups.
+    """
+    keep = ~np.isnan(epochs)
+    epochs, groups = epochs[keep], np.asarray(groups)[keep]
+    if not len(epochs):
+        return pd.DataFrame()
+    begin = epochs.min() // 60 * 60
+    minutes = int(np.ceil((epochs.max() - begin + 1) / 60.0 / max_bins))
+    interval = 60 * max(minutes, 1)
+    bins = ((epochs - begin) // interval).astype(int)
+    table = pd.crosstab(bins, groups)
+    table.index = pd.to_datetime(begin + table.index * interval, unit='s')
+    table.index.name = 'per {} min'.format(interval // 60)
+    return table
+
+
+def _date_axis(ax):
+    locator = mdates.AutoDateLocator()
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(mdates.AutoDateFormatter(locator))
+
+
+def _chart(series, title, ylabel):
+    """
+    series: [(label, epochs, y)], returns the chart as an embedded png image,
+    an empty string if matplotlib is not installed
+    """
+    if plt is None:
+        return ''
+    fig, ax = plt.subplots(figsize=(12, 3.5))
+    try:
+        for label, x, y in series:
+            ax.plot(mdates.epoch2num(x), y, label=label, linewidth=0.8)
+        _date_axis(ax)
+        ax.set_title(title)
+        ax.set_ylabel(ylabel)
+        ax.legend(loc='upper right', fontsize='small')
+        buf = StringIO()
+        fig.savefig(buf, format='png', dpi=80, bbox_inches='tight')
+    finally:
+        plt.close(fig)
+    return '<img src="data:image/png;base64,{}"/>'.format(
+        base64.b64encode(buf.getvalue()))
+
+
+HTML_REPORT = """<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; font-size: 13px; }}
+table {{ border-collapse: collapse; margin-bottom: 16px; }}
+th, td {{ border: 1px solid #ccc; padding: 2px 8px; text-align: right; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+{sections}
+</body>
+</html>
+"""
+
+
+class EventStore(object):
+    """
+    EventStore loads the trace events into the events table of a sqlite
+    database, indexed by task_id, task_name, pid and the timestamp.
+    The events are inserted by batches of batch_size, a transaction a
+    batch, the indexes are created when the store is closed so the
+    load does not maintain them.
+    @path: the database
+    @batch_size: the events of a batch
+    @create: drop the events already loaded
+    @readonly: only query the events of an existing database, IOError if
+               it does not exist
+    """
+    fields = TraceEvent._fields
+    indexes = ('task_id', 'task_name', 'pid', 'ts')
+
+    def __init__(self, path, batch_size=10000, create=False, readonly=False):
+        super(EventStore, self).__init__()
+        self.path = path
+        self.count = 0
+        self.readonly = readonly
+        self._batch_size = batch_size
+        self._batch = []
+        if readonly and not os.path.isfile(path):
+            raise IOError("no event database {}, load it by build --db".format(path))
+        self._db = sqlite3.connect(path)
+        self._db.text_factory = str
+        if readonly:
+            self._db.execute("PRAGMA query_only=ON")
+            return
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        if create:
+            self._db.execute("DROP TABLE IF EXISTS events")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS events (kind TEXT, ts TEXT, "
+            "epoch REAL, pid TEXT, task_id TEXT, task_name TEXT, queue TEXT, "
+            "retries INTEGER, value REAL, node TEXT)")
+        self._insert = "INSERT INTO events VALUES ({})".format(
+            ", ".join("?" * len(self.fields)))
+
+    def add(self, ev, report=None):
+        """
+        Add an event, it can be dispatched to as a report handler
+        """
+        self._batch.append(ev)
+        if len(self._batch) >= self._batch_size:
+            self.flush()
+
+    def add_many(self, events):
+        self._batch.extend(events)
+        if len(self._batch) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._batch:
+            with self._db:
+                self._db.executemany(self._insert, self._batch)
+            self.count += len(self._batch)
+            self._batch = []
+
+    def query(self, task_id=None, task_name=None, pid=None, kind=None,
+              begin=None, end=None, limit=None):
+        """
+        The events matching all the conditions given ordered by time,
+        the time range is [begin, end) of the timestamps, a prefix of
+        the timestamp e.g. "2015-04-14 10:02" is a valid bound.
+        Returns a DataFrame
+        """
+        conditions, args = [], []
+        for field, value in (('task_id', task_id), ('task_name', task_name),
+                             ('pid', pid), ('kind', kind)):
+            if value is not None:
+                conditions.append("{} = ?".format(field))
+                args.append(value)
+        if begin is not None:
+            conditions.append("ts >= ?")
+            args.append(begin)
+        if end is not None:
+            conditions.append("ts < ?")
+            args.append(end)
+        sql = "SELECT * FROM events"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY ts, rowid"
+        if limit:
+            sql += " LIMIT {:d}".format(limit)
+        return pd.read_sql_query(sql, self._db, params=args)
+
+    def close(self):
+        if self.readonly:
+            self._db.close()
+            return
+        self.flush()
+        for field in self.indexes:
+            self._db.execute("CREATE INDEX IF NOT EXISTS events_{0} "
+                             "ON events ({0})".format(field))
+        self._db.commit()
+        self._db.close()
+
+
+class Report(object):
+    """
+    Report keeps the output state of one report builder
+    @name: the builder name[worker|queue]
+    @header: the header of the report
+    @out_file: the report to write
+    @html_report: the html report to create
+    @orphans: the csv report of the pending records evicted or never
+              completed, None for no such report
+    @sink: the sink class of the report type, default CsvSink
+    @types: the column types of a columnar report
+    """
+    def __init__(self, name, header, out_file, html_report, orphans=None,
+                 sink=CsvSink, types=None):
+        super(Report, self).__init__()
+        self.name = name
+        self.header = header
+        self.out_file = out_file
+        self.html_report = html_report
+        self.orphans = orphans
+        self.sink = sink
+        self.types = types
+        # task_id -> the uncompleted record, waiting for its partner lines
+        self.pending = OrderedDict()
+        # reason -> the number of the records spilled
+        self.spilled = Counter()
+        self._sink = None
+        self._orphans = None
+
+    def open(self, append=False):
+        """
+        Create the report with the header, or append to the existing
+        one if append is set.
+        """
+        try:
+            self._sink = self.sink(self.out_file, self.header, self.types,
+                                   append=append)
+            if self.orphans:
+                self._orphans = CsvSink(self.orphans, ('reason',) + self.header,
+                                        append=append)
+        except IOError:
+            raise
+
+    def write(self, data):
+        self._sink.write(data)
+
+    def write_rows(self, rows):
+        """
+        Write the rows collected by ChunkReport
+        """
+        self._sink.write_rows(rows)
+
+    def spill(self, reason, record):
+        """
+        Count the pending record leaving the pending table without
+        being completed, and write it to the orphans report.
+        @reason: expired, evicted or unfinished
+        """
+        self.spilled[reason] += 1
+        if self._orphans:
+            self._orphans.write(dict(record, reason=reason))
+
+    def sync(self):
+        """
+        Flush the written rows to disk, returns the sizes of the report
+        and the orphans report
+        """
+        return [s.sync() for s in (self._sink, self._orphans) if s]
+
+    def truncate(self, sizes):
+        """
+        Drop the rows written after sizes, the next row is appended
+        """
+        for s, size in zip([s for s in (self._sink, self._orphans) if s], sizes):
+            s.truncate(size)
+
+    def close(self):
+        for s in (self._sink, self._orphans):
+            if s:
+                s.close()
+        self._sink = self._orphans = None
+
+
+# header: the csv header of the report
+# name_format: the report name format of {name} of the log and {type}
+# handlers: {event kind: the name of the Analyzer handler}
+# ts_fields: the timestamp fields of the rows
+# types: the types of the non string columns of a columnar report
+# top: the columns the top rows of the html report are ranked by, by
+#      the largest of them, () for no top rows
+ReportBuilder = namedtuple('ReportBuilder', ('header', 'name_format',
+                                             'handlers', 'ts_fields',
+                                             'types', 'top'))
+
+
+class _LineBuffer(list):
+    write = list.append
+
+
+class ChunkReport(Report):
+    """
+    ChunkReport collects the rows of a report instead of writing them,
+    it is used by the parallel build to build one chunk of the log.
+    Every row is kept as (seq, task_id, row), seq is the number of the
+    line completed the row in the chunk, row is the csv line or the
+    tuple of the values if not csv_rows.
+    """
+    def __init__(self, name, header, csv_rows=True):
+        super(ChunkReport, self).__init__(name, header, None, None)
+        self.seq = 0
+        self.rows = []
+        self._buf = _LineBuffer()
+        self._writer = csv.DictWriter(self._buf, header) if csv_rows else None
+
+    def open(self, append=False):
+        pass
+
+    def write(self, data):
+        if self._writer:
+            self._writer.writerow(data)
+            row = self._buf.pop()
+        else:
+            row = tuple(data.get(k) for k in self.header)
+        self.rows.append((self.seq, data['task_id'], row))
+
+
+def rotation_set(log):
+    """
+    The members of the rotation set of the log written by
+    RotatingFileHandler in chronological order, e.g.
+    task.log.50 ... task.log.2.gz, task.log.1, task.log
+    """
+    d = os.path.dirname(log) or os.curdir
+    base = os.path.basename(log)
+    pattern = re.compile(r'^%s\.(\d+)(\.gz)?$' % re.escape(base))
+    rotated = []
+    for f in os.listdir(d):
+        mt = pattern.match(f)
+        if mt:
+            rotated.append((int(mt.group(1)), os.path.join(d, f)))
+    members = [path for _, path in sorted(rotated, reverse=True)]
+    if os.path.exists(log):
+        members.append(log)
+    return members
+
+
+def _is_gzip(log):
+    with open(log, 'rb') as f:
+        return f.read(2) == '\x1f\x8b'
+
+
+def _open_log(log):
+    """
+    Open a log member, the gzip compressed one is decompressed
+    transparently.
+    """
+    return gzip.open(log, 'rb') if _is_gzip(log) else open(log, 'r')
+
+
+def node_name(log):
+    """
+    The node of a node log, the directory of the log if it has one,
+    e.g. node3/task.log, or the log name, e.g. node3.log
+    """
+    return os.path.basename(os.path.dirname(log)) or \
+        os.path.basename(log).split('.')[0]
+
+
+def node_events(node, logs, kinds=None, offset=0.0):
+    """
+    The events of the logs of a node tagged with the node, the pid is
+    the node/pid. The clock is corrected by offset, the seconds the
+    node clock is ahead of the reference clock.
+    """
+    for log in logs:
+        with _open_log(log) as f:
+            for ev in classifier.events(f, kinds):
+                if offset:
+                    epoch = ev.epoch - offset
+                    ev = ev._replace(ts=decoder.encode(epoch), epoch=epoch)
+                yield ev._replace(pid='{}/{}'.format(node, ev.pid), node=node)
+
+
+def merge_events(nodes, kinds=None, offsets=None):
+    """
+    The k-way merge of the events of the nodes by the corrected time,
+    only the next event of every node is kept in memory.
+    @nodes: [(node, [the logs of the node])]
+    @offsets: {node: the clock offset of the node}
+    """
+    offsets = offsets or {}
+    streams = [((ev.epoch, i, n, ev) for n, ev in
+                enumerate(node_events(node, logs, kinds, offsets.get(node, 0.0))))
+               for i, (node, logs) in enumerate(nodes)]
+    for _, _, _, ev in heapq.merge(*streams):
+        yield ev
+
+
+def estimate_offsets(nodes, max_pending=1 << 20):
+    """
+    Estimate the clock offset of every node from the publish -> received
+    pairs of the attempts published on one node and received on another.
+    The first attempts are published by the apps, the retries by the
+    pool processes of the workers, so the workers are paired both ways.
+    The min delay of a pair of nodes a -> b is the delay of the network
+    plus the offset of b to a. With the pairs of both directions the
+    offset is half the difference of their min delays, the nodes paired
+    both ways are a group of known offsets to each other. A group paired
+    one way only is shifted the least its pairs demand, i.e. only if a
+    task was received before it was published, and warned about.
+    The offsets are of the group of the first node.
+    Returns {node: the seconds the node clock is ahead of the first one}
+    """
+    # The received line has no retries, it is the attempt of the apply
+    # line the same consumer logs after it. The attempt of a received is
+    # kept by (task_id, pid) until its apply, the paired attempt by
+    # task_id#retries as None, a skewed received may be merged before
+    # its publish.
+    pending = PendingTable(max_pending)
+    received = PendingTable(max_pending)
+    delays = {}
+    for ev in merge_events(nodes, ('publish', 'received', 'apply')):
+        if ev.kind == 'received':
+            received[(ev.task_id, ev.pid)] = ev
+            continue
+        if ev.kind == 'apply':
+            rx = received.pop((ev.task_id, ev.pid), None)
+            if rx is None:
+                continue
+            ev = rx._replace(retries=ev.retries)
+        key = '{}#{}'.format(ev.task_id, ev.retries)
+        this = (ev.kind, ev.node, ev.epoch)
+        other = pending.get(key, ())
+        if other == ():
+            pending[key] = this
+            continue
+        if other is None or other[0] == ev.kind:
+            continue
+        pending[key] = None
+        published, rx = (other, this) if ev.kind == 'received' else (this, other)
+        if published[1] == rx[1]:
+            continue
+        pair = (published[1], rx[1])
+        delay = rx[2] - published[2]
+        if pair not in delays or delay < delays[pair]:
+            delays[pair] = delay
+
+    names = [node for node, _ in nodes]
+    # the groups of the nodes paired both ways, {node: offset to the
+    # first node of the group}
+    both = {}
+    for (a, b), d in delays.iteritems():
+        if (b, a) in delays:
+            both.setdefault(a, []).append((b, (d - delays[(b, a)]) / 2))
+    groups = []
+    grouped = set()
+    for n in names:
+        if n in grouped:
+            continue
+        rel = {n: 0.0}
+        todo = [n]
+        while todo:
+            a = todo.pop(0)
+            for b, r in sorted(both.get(a, ())):
+                if b not in rel:
+                    rel[b] = rel[a] + r
+                    todo.append(b)
+        grouped.update(rel)
+        groups.append(rel)
+
+    offsets = dict(groups[0])
+    placed = [False] * len(groups)
+    placed[0] = True
+    clamped = []
+    progress = True
+    while progress:
+        progress = False
+        for i, rel in enumerate(groups):
+            if placed[i]:
+                continue
+            # the bounds of the shift of the group and the shifts every
+            # pair alone demands
+            lo, hi, demands = float('-inf'), float('inf'), []
+            for b, rb in rel.iteritems():
+                for a, oa in offsets.iteritems():
+                    if (a, b) in delays:
+                        d = delays[(a, b)]
+                        hi = min(hi, oa + d - rb)
+                        demands.append(oa + min(d, 0.0) - rb)
+                    if (b, a) in delays:
+                        d = delays[(b, a)]
+                        lo = max(lo, oa - d - rb)
+                        demands.append(oa - min(d, 0.0) - rb)
+            if not demands:
+                continue
+            shift = max(demands)
+            if lo > hi:
+                shift = (lo + hi) / 2
+            else:
+                shift = min(max(shift, lo), hi)
+            for b, rb in rel.iteritems():
+                offsets[b] = shift + rb
+            if lo == float('-inf') or hi == float('inf'):
+                clamped.extend(sorted(rel))
+            placed[i] = True
+            progress = True
+    unpaired = [n for n in names if n not in offsets]
+    if clamped:
+        print("warning: the clock offsets of {} are only clamped, they are paired "
+              "one way with the other nodes".format(', '.join(clamped)))
+    if unpaired:
+        print("warning: the clock offsets of {} are not corrected, they are not "
+              "paired with the other nodes".format(', '.join(unpaired)))
+    return dict((node, offsets.get(node, 0.0)) for node in names)
+
+
+def _chunk_ranges(log, chunks):
+    """
+    Split the log into at most chunks (log, start, end) byte ranges,
+    every range starts at the beginning of a line and ends after a
+    newline. A gzip compressed log is one range (log, 0, None).
+    """
+    if _is_gzip(log):
+        return [(log, 0, None)]
+    size = os.path.getsize(log)
+    bounds = [0]
+    with open(log, 'rb') as f:
+        for i in xrange(1, chunks):
+            f.seek(max(size * i // chunks, bounds[-1]))
+            f.readline()
+            pos = f.tell()
+            if pos >= size:
+                break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+    bounds.append(size)
+    return [(log, b, e) for b, e in zip(bounds[:-1], bounds[1:])]
+
+
+def _read_chunk(log, start, end):
+    if end is None:
+        with _open_log(log) as f:
+            return StringIO(f.read())
+    with open(log, 'rb') as f:
+        f.seek(start)
+        return StringIO(f.read(end - start))
+
+
+def _build_chunk(args):
+    """
+    Build the reports of one chunk of the log in a worker process.
+    Returns the rows and the pending records of every report, the
+    task ids the chunk has events of, the time of its last event, all
+    its events if they are loaded into the store and the task_id of
+    the first publishing of every pid before its first Task.apply_async
+    send(None if the send is first), which may be joined to the send of
+    the chunks before it.
+    """
+    log, start, end, names, csv_rows, store = args
+    analyzer = Analyzer(log=log)
+    reports = [ChunkReport(n, Analyzer._builders[n].header, csv_rows)
+               for n in names]
+    dispatch = analyzer._dispatch(reports)
+    classify = classifier.classify
+    kinds = None if store else dispatch
+    task_ids = set()
+    events = []
+    joins = {}
+    now = 0
+    for seq, l in enumerate(_read_chunk(log, start, end)):
+        ev = classify(l, kinds)
+        if ev is None:
+            continue
+        if store:
+            events.append(ev)
+        if ev.kind == 'publish' or ev.kind == 'send' and ev.task_id is None:
+            joins.setdefault('app-{}'.format(ev.pid), ev.task_id)
+        task_ids.add(ev.task_id)
+        now = ev.epoch
+        for func, report in dispatch.get(ev.kind, ()):
+            report.seq = seq
+            func(ev, report)
+    return ([r.rows for r in reports], [r.pending for r in reports],
+            task_ids, now, events, joins)
+
+
+def _replay_chunk(args):
+    """
+    Collect the (seq, event) of the task_ids of one chunk, they may
+    have pending records from the chunks before it. The Task.apply_async
+    send of the chunk joined to the publishing of such a task is
+    collected right before the publishing, as the serial build joins
+    them by the pid.
+    """
+    log, start, end, kinds, task_ids = args
+    classify = classifier.classify
+    joining = 'send' in kinds
+    # pid -> the (seq, event) of its last Task.apply_async send not
+    # published yet
+    sent = {}
+    events = []
+    for seq, l in enumerate(_read_chunk(log, start, end)):
+        task_id = _line_task_id(l)
+        if task_id is None or task_id not in task_ids:
+            if joining:
+                ev = classify(l, ('send', 'publish'))
+                if ev is None:
+                    continue
+                if ev.task_id is None:
+                    sent[ev.pid] = (seq, ev)
+                elif ev.kind == 'publish':
+                    sent.pop(ev.pid, None)
+            continue
+        ev = classify(l, kinds)
+        if ev is None:
+            continue
+        if ev.kind == 'publish' and ev.pid in sent:
+            events.append(sent.pop(ev.pid))
+        events.append((seq, ev))
+    return events
+
+
 class Analyzer(object):
     """
     Analyzer is used to analyze the celery log by convert the
     key data to csv format, and then use pandas to analyze the
     data.
+    @data: the report to build[worker|queue|lifecycle|retry|pool|consumer
+           |all], all builds every registered report in one pass of the log
     @log: the log file to analyze
-    @type: the report type:[csv]
+    @rotated: analyze the whole rotation set of the log, see rotation_set
+    @type: the report type:[csv|parquet|feather|npy], parquet and
+           feather need pyarrow, npy is used if it is not installed
     @out: the output format
+    @jobs: the number of processes to parse the log, default 1
+    @follow: append to the existing reports, used by follow
+    @max_pending: the max number of pending records of a report
+    @pending_ttl: the max seconds a pending record waits for its partner
+    @orphans: write the pending records evicted or never completed to
+              the <report>_orphans.csv
+    @checkpoint: the checkpoint file of follow
+    @chunk_size: the MB of log every process parses at a time
     """
     _csv_execution_fields = ('start', 'end', 'queue', 'task_id',
                              'task_name', 'duration', 'retries')
     _csv_inqueue_fields = ('task_id', 'task_name', 'queue',
                            'inq', 'received', 'duration', 'outq',
                            'latency', 'retries')
+    # the hops of a task attempt in the order they are logged
+    _lifecycle_hops = ('send', 'publish', 'received', 'got', 'apply',
+                       'accepted', 'start', 'end', 'done')
+    # stage: (from hop, to hop), executing is the seconds billiard spends
+    _lifecycle_stages = OrderedDict([
+        ('sending', ('send', 'publish')),
+        ('inqueue', ('publish', 'received')),
+        ('dispatch', ('received', 'got')),
+        ('pool', ('got', 'apply')),
+        ('accept', ('apply', 'accepted')),
+        ('waiting', ('apply', 'start')),
+        ('executing', ('start', 'end')),
+        ('notify', ('end', 'done')),
+    ])
+    _csv_lifecycle_fields = ('task_id', 'task_name', 'queue', 'retries') + \
+        _lifecycle_hops + tuple(_lifecycle_stages) + ('total',)
+    # retries of the last attempt, first send/publishing, publish and got
+    # of the last attempt, last done of the chain and the seconds
+    _csv_retry_fields = ('task_id', 'task_name', 'queue', 'retries',
+                         'first', 'publish', 'got', 'last', 'total',
+                         'retry_lost', 'countdown', 'executing', 'final')
+    # the pool process executing an attempt, the consumer applying it,
+    # when it waited in the consumer(received -> apply) and in the
+    # pool(apply -> start)
+    _csv_pool_fields = ('pid', 'consumer', 'task_id', 'task_name', 'queue', 'retries',
+                        'received', 'apply', 'start', 'end',
+                        'reserved', 'queued', 'busy')
+    # the consumer pid of an attempt and its waits: dispatch(received ->
+    # got), reserved(got -> apply), pipe(apply -> start), ack(start ->
+    # accepted)
+    _csv_consumer_fields = ('pid', 'task_id', 'task_name', 'queue', 'retries',
+                            'received', 'got', 'apply', 'start', 'accepted') + \
+        CONSUMER_WAITS
 
+    # The registered report builders, every builder is fed with the
+    # events of the same log line by _build_report in this order.
+    _builders = OrderedDict([
+        ('worker', ReportBuilder(_csv_execution_fields, "{name}.{type}",
+                                 {'start': '_worker_start',
+                                  'end': '_worker_end'},
+                                 ('start', 'end'),
+                                 {'start': 'S23', 'end': 'S23',
+                                  'task_id': 'S36', 'duration': 'f8',
+                                  'retries': 'i8'},
+                                 ('duration',))),
+        ('queue', ReportBuilder(_csv_inqueue_fields, "{name}_queue.{type}",
+                                {'publish': '_queue_publish',
+                                 'received': '_queue_received',
+                                 'accepted': '_queue_accepted'},
+                                ('inq', 'received', 'outq'),
+                                {'inq': 'S23', 'received': 'S23',
+                                 'outq': 'S23', 'task_id': 'S36',
+                                 'duration': 'f8', 'latency': 'f8',
+                                 'retries': 'i8'},
+                                ('duration',))),
+        ('lifecycle', ReportBuilder(_csv_lifecycle_fields,
+                                    "{name}_lifecycle.{type}",
+                                    {'retry': '_lifecycle_send',
+                                     'send': '_lifecycle_send',
+                                     'publish': '_lifecycle_publish',
+                                     'received': '_lifecycle_hop',
+                                     'got': '_lifecycle_hop',
+                                     'apply': '_lifecycle_hop',
+                                     'accepted': '_lifecycle_hop',
+                                     'start': '_lifecycle_hop',
+                                     'end': '_lifecycle_end',
+                                     'done': '_lifecycle_done'},
+                                    _lifecycle_hops,
+                                    dict([(h, 'S23') for h in _lifecycle_hops] +
+                                         [(st, 'f8') for st in _lifecycle_stages] +
+                                         [('total', 'f8'), ('task_id', 'S36'),
+                                          ('retries', 'i8')]),
+                                    ('total',))),
+        ('retry', ReportBuilder(_csv_retry_fields, "{name}_retry.{type}",
+                                {'send': '_retry_publish',
+                                 'retry': '_retry_publish',
+                                 'publish': '_retry_publish',
+                                 'got': '_retry_got',
+                                 'apply': '_retry_apply',
+                                 'end': '_retry_end',
+                                 'done': '_retry_done'},
+                                ('first', 'publish', 'got', 'last'),
+                                {'first': 'S23', 'publish': 'S23', 'got': 'S23',
+                                 'last': 'S23', 'task_id': 'S36', 'retries': 'i8',
+                                 'total': 'f8', 'retry_lost': 'f8',
+                                 'countdown': 'f8', 'executing': 'f8',
+                                 'final': 'f8'},
+                                ('total',))),
+        ('pool', ReportBuilder(_csv_pool_fields, "{name}_pool.{type}",
+                               {'received': '_pool_wait',
+                                'apply': '_pool_wait',
+                                'start': '_pool_start',
+                                'end': '_pool_end'},
+                               ('received', 'apply', 'start', 'end'),
+                               {'pid': 'S32', 'consumer': 'S32', 'task_id': 'S36',
+                                'retries': 'i8', 'received': 'S23', 'apply': 'S23',
+                                'start': 'S23', 'end': 'S23',
+                                'reserved': 'f8', 'queued': 'f8',
+                                'busy': 'f8'},
+                               ('busy',))),
+        ('consumer', ReportBuilder(_csv_consumer_fields, "{name}_consumer.{type}",
+                                   {'received': '_consumer_hop',
+                                    'got': '_consumer_hop',
+                                    'apply': '_consumer_hop',
+                                    'start': '_consumer_hop',
+                                    'accepted': '_consumer_accepted'},
+                                   ('received', 'got', 'apply', 'start',
+                                    'accepted'),
+                                   dict([('pid', 'S32'), ('task_id', 'S36'),
+                                         ('retries', 'i8')] +
+                                        [(h, 'S23') for h in ('received', 'got',
+                                         'apply', 'start', 'accepted')] +
+                                        [(w, 'f8') for w in CONSUMER_WAITS]),
+                                   CONSUMER_WAITS)),
+    ])
 
     def __init__(self, data=None, log='celery.log', type="csv", *args, **kwargs):
         super(Analyzer, self).__init__()
         self._data = data
         self._log = log
+        self._logs = (kwargs.get('rotated') and rotation_set(log)) or [log]
+        # [(node, [logs])] of the node logs merged into one stream
+        self._nodes = [(node_name(l), (kwargs.get('rotated') and rotation_set(l)) or [l])
+                       for l in kwargs.get('nodes') or []]
+        self._offsets = {}
         self._report_dir = "reports"
-        self._type = type or "csv"
-        self._name_format = "{name}.{type}" if data == 'worker' \
-            else "{name}_queue.{type}"
-        self._stat_report_name_format = "{name}_stat.{suffix}" if data== 'worker' \
-            else "{name}_queue_stat.{suffix}"
-        self._out_file = self._name_format.format(name=log.split(".")[0],
-                                                           type=type)
-        self._html_report = self._name_format.format(name=log.split(".")[0],
-                                                     type="html")
-        self._stat_report = self._stat_report_name_format.format(name=log.split(".")[0],
-                                                     suffix="html")
+        self._type = report_type(type)
         self._args = args
         self._kwargs = kwargs
-        self._header = self._csv_inqueue_fields if self._data == 'queue' \
-        else self._csv_execution_fields
-        self._writer = self._build_csv_writer(self._out_file, self._header)
+        self._jobs = kwargs.get('jobs') or 1
+        self._chunk_size = (kwargs.get('chunk_size') or 32) << 20
+        if data == 'all':
+            datas = list(self._builders)
+        elif data in self._builders:
+            datas = [data]
+        else:
+            datas = []
+        self._reports = [self._build_csv_writer(d) for d in datas]
+        # the sqlite database every event is loaded into
+        self._store = EventStore(kwargs['db'], create=True) \
+            if kwargs.get('db') else None
 
     @property
-    def html_report(self):
-        return self._html_report
-
-    @html_report.setter
-    def html_report(self, new_name):
-        self._html_report = new_name
+    def reports(self):
+        return self._reports
 
-    def _build_csv_writer(self, csv_f, header):
+    def _build_csv_writer(self, data):
         if not os.path.exists(self._report_dir):
             os.mkdir(self._report_dir)
-        self._out_file = os.path.join(self._report_dir, os.path.basename(csv_f))
-        def _build_csv_header():
+        builder = self._builders[data]
+        name = os.path.basename(self._log).split(".")[0]
+        out_file = os.path.join(self._report_dir,
+            builder.name_format.format(name=name, type=self._type))
+        html_report = os.path.join(self._report_dir,
+            builder.name_format.format(name=name, type="html"))
+        orphans = "{}_orphans.csv".format(os.path.splitext(out_file)[0]) \
+            if self._kwargs.get('orphans') else None
+        report = Report(data, builder.header, out_file, html_report, orphans,
+                        SINKS[self._type], builder.types)
+        report.pending = self._pending_table(report)
+        report.open(append=self._kwargs.get('follow'))
+        return report
+
+    def _pending_table(self, report):
+        return PendingTable(self._kwargs.get('max_pending'),
+                            self._kwargs.get('pending_ttl'),
+                            self._builders[report.name].ts_fields,
+                            report.spill)
+
+    def _expire(self, reports, now):
+        """
+        Evict the expired pending records, returns when to expire next
+        """
+        for r in reports:
+            r.pending.expire(now)
+        return now + 1 if self._kwargs.get('pending_ttl') else float('inf')
+
+    def _queue_publish(self, ev, report):
+        pending = report.pending
+        task_id = ev.task_id
+        _d = {'task_id':task_id, 'task_name':ev.task_name,
+              'queue':ev.queue, 'inq':ev.ts,
+              'received':None, 'duration':None, 'outq':None,
+              'latency':None, 'retries':ev.retries
+              }
+        if task_id in pending:
+            _t = pending[task_id]
+            for k in _d:
+                if _d[k] != _t[k] and _d[k]:
+                    _t[k] = _d[k]
+        else:
+            # add to dict
+            pending[task_id] = _d
+
+    def _queue_received(self, ev, report):
+        pending = report.pending
+        task_id = ev.task_id
+        if task_id in pending:
+            _t = pending[task_id]
+            _t['received'] = ev.ts
+            if _t['inq']:
+                _t['duration'] = ev.epoch - decoder.decode(_t['inq'])
+        else:
+            # add to dict
+            pending[task_id] = {'task_id':task_id, 'task_name':ev.task_name,
+                                'queue':ev.queue, 'inq':None,
+                                'received':ev.ts, 'duration':0,
+                                'outq':None, 'latency':0,
+                                'retries':ev.retries}
+
+    def _queue_accepted(self, ev, report):
+        pending = report.pending
+        task_id = ev.task_id
+        if task_id in pending:
+            _t = pending[task_id]
+            _t['outq'] = ev.ts
+            if _t['received']:
+                _t['latency'] = ev.epoch - decoder.decode(_t['received'])
+            # output the data and remove the item
+            report.write(_t)
+            pending.pop(task_id)
+        else:
+            # add to dict
+            pending[task_id] = {'task_id':task_id, 'task_name':ev.task_name,
+                                'queue':ev.queue, 'inq':None,
+                                'received':None, 'duration':0,
+                                'outq':ev.ts, 'latency':0,
+                                'retries':ev.retries}
+
+    def _worker_start(self, ev, report):
+        report.pending[ev.task_id] = {'start': ev.ts, 'end': None,
+                                      'queue':ev.queue,
+                                      'task_id':ev.task_id,
+                                      'task_name': ev.task_name,
+                                      'duration': None,
+                                      'retries': ev.retries}
+
+    def _worker_end(self, ev, report):
+        pending = report.pending
+        task_id = ev.task_id
+        if task_id in pending:
+            _t = pending.pop(task_id)
+            _t['end'] = ev.ts
+            _t['duration'] = ev.value
+            report.write(_t)
+        else:
+            pending[task_id] = {'start': None, 'end': ev.ts,
+                                'queue':ev.queue, 'task_id':task_id,
+                                'task_name': ev.task_name,
+                                'duration': ev.value,
+                                'retries': ev.retries}
+
+    def _lifecycle_record(self, ev, report):
+        """
+        The pending record of the task attempt of the event. An event
+        logging the retries belongs to the attempt of its retries, the
+        others belong to the latest attempt. The latest attempt is
+        pending by the task_id, the attempt still in flight when its
+        retry is sent is moved to task_id#retries.
+        """
+        pending = report.pending
+        key = ev.task_id
+        rec = pending.get(key)
+        retries = str(ev.retries)
+        if ev.kind not in ('received', 'got', 'accepted'):
+            older = '{}#{}'.format(key, retries)
+            if older in pending:
+                key, rec = older, pending[older]
+            elif rec is not None and rec['retries'] != retries:
+                if int(retries) < int(rec['retries']):
+                    key, rec = older, None
+                else:
+                    # a new attempt
+                    pending['{}#{}'.format(key, rec['retries'])] = pending.pop(key)
+                    rec = None
+        if rec is None:
+            rec = pending[key] = {'task_id': ev.task_id,
+                                  'task_name': ev.task_name,
+                                  'queue': ev.queue, 'retries': retries}
+        return key, rec
+
+    def _lifecycle_send(self, ev, report):
+        if ev.task_id is None:
+            # Task.apply_async, joined by the pid to its publishing
+            report.pending['app-{}'.format(ev.pid)] = {'send': ev.ts}
+            return
+        _, rec = self._lifecycle_record(ev, report)
+        rec['send'] = ev.ts
+
+    def _lifecycle_publish(self, ev, report):
+        _, rec = self._lifecycle_record(ev, report)
+        rec['publish'] = ev.ts
+        sent = report.pending.pop('app-{}'.format(ev.pid), None)
+        if sent is not None and not rec.get('send'):
+            rec['send'] = sent['send']
+
+    def _lifecycle_hop(self, ev, report):
+        if ev.kind == 'accepted' and ev.task_id not in report.pending:
+            # the ack of a short task may be logged after it is done
+            return
+        _, rec = self._lifecycle_record(ev, report)
+        rec[ev.kind] = ev.ts
+
+    def _lifecycle_end(self, ev, report):
+        _, rec = self._lifecycle_record(ev, report)
+        rec['end'] = ev.ts
+        rec['executing'] = ev.value
+
+    def _lifecycle_done(self, ev, report):
+        key, rec = self._lifecycle_record(ev, report)
+        rec['done'] = ev.ts
+        t = dict((h, decoder.decode(rec[h])) for h in self._lifecycle_hops
+                 if rec.get(h))
+        for stage, (a, b) in self._lifecycle_stages.items():
+            if stage not in rec:
+                rec[stage] = t[b] - t[a] if a in t and b in t else None
+        first = t.get('send', t.get('publish'))
+        rec['total'] = t['done'] - first if first is not None else None
+        report.write(rec)
+        report.pending.pop(key)
+
+    def _retry_publish(self, ev, report):
+        """
+        The send, retry and publishing of an attempt, the first one
+        starts the chain of the task_id
+        """
+        if ev.task_id is None:
+            return
+        chain = report.pending.get(ev.task_id)
+        if chain is None:
+            chain = report.pending[ev.task_id] = {
+                'task_id': ev.task_id, 'task_name': ev.task_name,
+                'queue': ev.queue, 'retries': 0, 'first': ev.ts,
+                'countdown': 0.0, 'executing': 0.0}
+        retries = int(ev.retries)
+        if retries > chain['retries']:
+            # a new attempt
+            chain['retries'] = retries
+            chain['got'] = None
+        if ev.kind == 'publish' and retries == chain['retries']:
+            chain['publish'] = ev.ts
+
+    def _retry_got(self, ev, report):
+        chain = report.pending.get(ev.task_id)
+        if chain is not None:
+            chain['got'] = ev.ts
+
+    def _retry_apply(self, ev, report):
+        # a retry waits for its countdown/eta between got and apply
+        chain = report.pending.get(ev.task_id)
+        if chain is not None and int(ev.retries) > 0 and chain.get('got'):
+            chain['countdown'] += ev.epoch - decoder.decode(chain['got'])
+
+    def _retry_end(self, ev, report):
+        chain = report.pending.get(ev.task_id)
+        if chain is not None and ev.value:
+            chain['executing'] += float(ev.value)
+
+    def _retry_done(self, ev, report):
+        """
+        The chain completes when its last attempt is done, the attempt
+        retried sends its retry before it is done
+        """
+        chain = report.pending.get(ev.task_id)
+        if chain is None or int(ev.retries) < chain['retries']:
+            return
+        first = decoder.decode(chain['first'])
+        publish = decoder.decode(chain['publish']) if chain.get('publish') \
+            else first
+        chain['last'] = ev.ts
+        chain['total'] = ev.epoch - first
+        chain['retry_lost'] = publish - first
+        chain['final'] = ev.epoch - publish
+        report.write(chain)
+        report.pending.pop(ev.task_id)
+
+    def _pool_wait(self, ev, report):
+        """
+        The attempt waiting to start is pending by the task_id, a
+        received after the apply is of the next attempt
+        """
+        rec = report.pending.get(ev.task_id)
+        if rec is None or (ev.kind == 'received' and rec.get('apply')):
+            rec = report.pending[ev.task_id] = {
+                'task_id': ev.task_id, 'task_name': ev.task_name,
+                'queue': ev.queue, 'retries': None}
+        rec[ev.kind] = ev.ts
+        if ev.kind == 'apply':
+            rec['retries'] = str(ev.retries)
+            rec['consumer'] = ev.pid
+
+    def _pool_start(self, ev, report):
+        """
+        The started attempt is pending by task_id#retries until its end,
+        the next attempt may be received before it ends
+        """
+        retries = str(ev.retries)
+        rec = report.pending.get(ev.task_id)
+        if rec is not None and rec['retries'] in (None, retries):
+            report.pending.pop(ev.task_id)
+        else:
+            rec = {'task_id': ev.task_id, 'task_name': ev.task_name,
+                   'queue': ev.queue}
+        rec.update(pid=ev.pid, start=ev.ts, retries=retries)
+        report.pending['{}#{}'.format(ev.task_id, retries)] = rec
+
+    def _pool_end(self, ev, report):
+        rec = report.pending.pop('{}#{}'.format(ev.task_id, ev.retries), None)
+        if rec is None:
+            rec = {'task_id': ev.task_id, 'task_name': ev.task_name,
+                   'queue': ev.queue, 'retries': str(ev.retries)}
+        rec.update(pid=ev.pid, end=ev.ts, busy=ev.value)
+        t = dict((h, decoder.decode(rec[h])) for h in ('received', 'apply', 'start')
+                 if rec.get(h))
+        rec['reserved'] = t['apply'] - t['received'] \
+            if 'received' in t and 'apply' in t else None
+        rec['queued'] = t['start'] - t['apply'] \
+            if 'apply' in t and 'start' in t else None
+        report.write(rec)
+
+    def _consumer_write(self, key, report):
+        rec = report.pending.pop(key)
+        t = dict((h, decoder.decode(rec[h])) for h in ('received', 'got', 'apply',
+                                                      'start', 'accepted')
+                 if rec.get(h))
+        for wait, (a, b) in zip(CONSUMER_WAITS, (('received', 'got'),
+                                                 ('got', 'apply'),
+                                                 ('apply', 'start'),
+                                                 ('start', 'accepted'))):
+            rec[wait] = t[b] - t[a] if a in t and b in t else None
+        report.write(rec)
+
+    def _consumer_hop(self, ev, report):
+        """
+        The attempt is pending by the task_id, it is written when it is
+        accepted or when the next attempt of the task is received. The
+        start of the pool process only completes the applied attempt of
+        its retries.
+        """
+        rec = report.pending.get(ev.task_id)
+        if ev.kind == 'start':
+            if rec is not None and rec.get('apply') and \
+                    rec['retries'] == str(ev.retries):
+                rec['start'] = ev.ts
+            return
+        if rec is not None and rec.get('apply') and \
+                (ev.kind != 'apply' or rec['retries'] != str(ev.retries)):
+            self._consumer_write(ev.task_id, report)
+            rec = None
+        if rec is None:
+            rec = report.pending[ev.task_id] = {
+                'pid': ev.pid, 'task_id': ev.task_id,
+                'task_name': ev.task_name, 'queue': ev.queue,
+                'retries': None}
+        rec[ev.kind] = ev.ts
+        if ev.kind == 'apply':
+            rec['retries'] = str(ev.retries)
+
+    def _consumer_accepted(self, ev, report):
+        rec = report.pending.get(ev.task_id)
+        if rec is None or not rec.get('apply'):
+            # the ack of the attempt written by the next one
+            return
+        rec['accepted'] = ev.ts
+        self._consumer_write(ev.task_id, report)
+
+    def _dispatch(self, reports):
+        """
+        event kind -> [(handler, report)]
+        """
+        dispatch = {}
+        for r in reports:
+            for kind, handler in self._builders[r.name].handlers.items():
+                dispatch.setdefault(kind, []).append((getattr(self, handler), r))
+        if self._store is not None:
+            for kind in classifier.kinds:
+                dispatch.setdefault(kind, []).append((self._store.add, None))
+        return dispatch
+
+    def _parse(self, dispatch):
+        if self._nodes:
+            return self._parse_nodes(dispatch)
+        # the pending records are carried from a member to the next one
+        expire_at = self._expire(self._reports, 0)
+        for log in self._logs:
             try:
-                with open(self._out_file, 'wb') as f:
-                    w = csv.DictWriter(f, header)
-                    w.writeheader()
-            except IOError:
+                with _open_log(log) as f:
+                    for ev in classifier.events(f, dispatch):
+                        try:
+                            for func, report in dispatch[ev.kind]:
+                                func(ev, report)
+                        except Exception as e:
+                             print("build report failed for {}".format(e))
+                             raise
+                        if ev.epoch >= expire_at:
+                            expire_at = self._expire(self._reports, ev.epoch)
+            except IOError as e:
+                print("Open file:{} error {}".format(log, e))
                 raise
+
+    def _parse_nodes(self, dispatch):
+        """
+        Estimate the clock offsets of the nodes, then feed the events of
+        the node logs merged by the corrected time to the reports.
+        """
+        if len(self._nodes) > 1 and self._kwargs.get('skew', True):
+            self._offsets = estimate_offsets(self._nodes)
+        expire_at = self._expire(self._reports, 0)
         try:
-            _build_csv_header()
-            try:
-                self._csv_fd = open(self._out_file, 'a')
-                return csv.DictWriter(self._csv_fd, self._header)
-            except IOError:
-                raise
-        except Exception:
+            for ev in merge_events(self._nodes, dispatch, self._offsets):
+                for func, report in dispatch[ev.kind]:
+                    func(ev, report)
+                if ev.epoch >= expire_at:
+                    expire_at = self._expire(self._reports, ev.epoch)
+        except IOError as e:
+            print("Open node logs error {}".format(e))
             raise
 
+    def _parse_parallel(self):
+        """
+        Split the logs into chunks, every chunk is built by a worker
+        process as if no task had pending records before it.
+        The pending records of a chunk are merged into the global
+        ones, and the events of the task_ids having global pending
+        records are replayed against them by task_id, then the rows of
+        the chunk are written in the order of the serial build.
+        """
+        names = [r.name for r in self._reports]
+        ranges = []
+        for log in self._logs:
+            chunks = os.path.getsize(log) // self._chunk_size + 1
+            if len(self._logs) == 1:
+                chunks = max(self._jobs * 4, chunks)
+            ranges += _chunk_ranges(log, chunks)
+        # the global pending records, also collect the replayed rows
+        csv_rows = SINKS[self._type].csv_rows
+        glob = [ChunkReport(r.name, r.header, csv_rows) for r in self._reports]
+        for g, r in zip(glob, self._reports):
+            g.pending = self._pending_table(r)
+        gdispatch = self._dispatch(glob)
+        # the store is loaded with the events of the chunks in order
+        store = self._store is not None
+        if store:
+            for kind in gdispatch:
+                gdispatch[kind] = [(f, r) for f, r in gdispatch[kind]
+                                   if r is not None]
+        kinds = set(k for k in gdispatch if gdispatch[k])
+        pool = multiprocessing.Pool(self._jobs)
+        try:
+            todo = iter(ranges)
+            queue = deque((rng, pool.apply_async(_build_chunk,
+                                                 (rng + (names, csv_rows, store),)))
+                          for rng in islice(todo, self._jobs * 2))
+            prev = None
+            while queue:
+                rng, result = queue.popleft()
+                rows, pendings, task_ids, now, events, joins = result.get()
+                if store:
+                    self._store.add_many(events)
+                for nrng in islice(todo, 1):
+                    queue.append((nrng, pool.apply_async(_build_chunk,
+                        (nrng + (names, csv_rows, store),))))
+                # The task_ids may have pending records before the chunk
+                candidates = set()
+                for g in glob:
+                    candidates.update(_task_id_of(k) for k in g.pending)
+                if prev:
+                    for p in prev[1]:
+                        candidates.update(_task_id_of(k) for k in p)
+                    candidates |= prev[2]
+                replay_ids = task_ids & candidates
+                # the publishing joined to a pending send by the pid
+                replay_ids.update(task_id for key, task_id in joins.iteritems()
+                                  if task_id and key in candidates)
+                replay = pool.apply_async(_replay_chunk,
+                    (rng + (kinds, replay_ids),)) \
+                    if replay_ids else None
+                if prev:
+                    self._reconcile(gdispatch, glob, *prev)
+                prev = (rows, pendings, replay_ids, replay, now, joins)
+            if prev:
+                self._reconcile(gdispatch, glob, *prev)
+            pool.close()
+            for g, r in zip(glob, self._reports):
+                r.pending = g.pending
+        except IOError as e:
+            print("Open file:{} error {}".format(self._log, e))
+            raise
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _reconcile(self, gdispatch, glob, rows, pendings, replay_ids, replay,
+                   now, joins):
+        for g in glob:
+            del g.rows[:]
+            # the send of the pid first in the chunk replaces its pending
+            # send, the publishing first in the chunk is replayed
+            for key, task_id in joins.iteritems():
+                if task_id is None:
+                    g.pending.pop(key, None)
+        if replay is not None:
+            for seq, ev in replay.get():
+                for func, report in gdispatch[ev.kind]:
+                    report.seq = seq
+                    func(ev, report)
+        for report, g, chunk_rows, pending in zip(self._reports, glob,
+                                                  rows, pendings):
+            if replay_ids:
+                chunk_rows = [r for r in chunk_rows if r[1] not in replay_ids]
+            report.write_rows(r[2] for r in heapq.merge(chunk_rows, g.rows))
+            for key, d in pending.iteritems():
+                if _task_id_of(key) not in replay_ids:
+                    g.pending[key] = d
+        self._expire(glob, now)
+
+    def _checkpoint_file(self):
+        name = os.path.basename(self._log).split(".")[0]
+        return self._kwargs.get('checkpoint') or \
+            os.path.join(self._report_dir, "{}.checkpoint".format(name))
+
+    def _save_checkpoint(self, log, inode, offset):
+        """
+        Save the offset of the log being followed together with the
+        pending records and the size of every report, so follow can be
+        resumed at the same point of the log and the reports.
+        """
+        state = {'log': log, 'inode': inode, 'offset': offset,
+                 'pending': dict((r.name, r.pending) for r in self._reports),
+                 'sizes': dict((r.name, r.sync()) for r in self._reports)}
+        ckpt = self._checkpoint_file()
+        try:
+            with open(ckpt + '.tmp', 'wb') as f:
+                cPickle.dump(state, f, cPickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(ckpt + '.tmp', ckpt)
+        except IOError as e:
+            print("Save checkpoint:{} error {}".format(ckpt, e))
+            raise
+
+    def _load_checkpoint(self):
+        """
+        Restore the pending records and the reports from the
+        checkpoint, returns the [(log, offset)] to read before
+        following the log.
+        """
+        ckpt = self._checkpoint_file()
+        state = None
+        if os.path.exists(ckpt):
+            with open(ckpt, 'rb') as f:
+                state = cPickle.load(f)
+            if set(state['pending']) != set(r.name for r in self._reports):
+                print("Checkpoint:{} is not of the same reports, "
+                      "ignore it".format(ckpt))
+                state = None
+        if state is None:
+            for r in self._reports:
+                r.close()
+                r.open()
+            return [(self._log, 0)]
+        for r in self._reports:
+            r.pending.update(state['pending'][r.name])
+            r.truncate(state['sizes'][r.name])
+        # The log may be rotated after the checkpoint, resume from the
+        # rotated member and read all the newer ones
+        members = [m for m in rotation_set(self._log) if not _is_gzip(m)]
+        for i, m in enumerate(members):
+            if os.stat(m).st_ino == state['inode']:
+                return [(m, state['offset'])] + [(x, 0) for x in members[i + 1:]]
+        print("Checkpointed log:{} is gone, follow {} from the "
+              "beginning".format(state['log'], self._log))
+        return [(self._log, 0)]
+
+    def follow(self, interval=1.0, checkpoint_interval=10.0):
+        """
+        Follow the log like tail -F, the rows are appended to the
+        reports as the tasks complete. The log offset and the pending
+        records are checkpointed every checkpoint_interval seconds and
+        at exit, so a restart resumes without parsing the log again.
+        """
+        def _stop(signum, frame):
+            raise KeyboardInterrupt()
+        signal.signal(signal.SIGTERM, _stop)
+        dispatch = self._dispatch(self._reports)
+        classify = classifier.classify
+        expire_at = self._expire(self._reports, 0)
+        todo = self._load_checkpoint()
+        log, offset = todo.pop(0)
+        f = open(log, 'r')
+        f.seek(offset)
+        inode = os.fstat(f.fileno()).st_ino
+        saved = time.time()
+        try:
+            while True:
+                l = f.readline()
+                if l.endswith('\n') or (l and todo):
+                    ev = classify(l, dispatch)
+                    if ev is not None:
+                        for func, report in dispatch[ev.kind]:
+                            func(ev, report)
+                        if ev.epoch >= expire_at:
+                            expire_at = self._expire(self._reports, ev.epoch)
+                    offset += len(l)
+                    continue
+                # at the end of the log or of a partial line
+                f.seek(offset)
+                if todo:
+                    f.close()
+                    log, offset = todo.pop(0)
+                    f = open(log, 'r')
+                    inode = os.fstat(f.fileno()).st_ino
+                    continue
+                if time.time() - saved >= checkpoint_interval:
+                    self._save_checkpoint(log, inode, offset)
+                    saved = time.time()
+                try:
+                    st = os.stat(self._log)
+                except OSError:
+                    st = None
+                if st is not None and st.st_ino != inode:
+                    # rotated, drain the old one and then follow the new one
+                    print("{} is rotated".format(self._log))
+                    todo.append((self._log, 0))
+                    continue
+                if st is not None and st.st_size < offset:
+                    print("{} is truncated".format(self._log))
+                    f.seek(0)
+                    offset = 0
+                    continue
+                for r in self._reports:
+                    r.sync()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._save_checkpoint(log, inode, offset)
+            f.close()
+            for r in self._reports:
+                r.close()
+            print("\nCheckpoint saved:{} {}:{}".format(self._checkpoint_file(),
+                                                      log, offset))
 
-    def _write_out(self, data):
-        self._writer.writerow(data)
-
-    def _collect_in_queue_lines(self, line, out_lines, pattern_tx="publishing",
-                               pattern_rx="(anan)+.*Received", sep=' '):
-        _tmp_lines = out_lines
-        prog_tx = re.compile(pattern_tx)
-        prog_rx = re.compile(pattern_rx)
-        prog_accept = re.compile("(anan)+.*task-accepted")
-
-        mt_tx = prog_tx.search(line)
-        mt_rx = prog_rx.search(line)
-        mt_accept = prog_accept.search(line)
-
-        if mt_tx:
-            data = line.rstrip('\n').split(sep)
-            date, ts, q, task_id, task_name, retries = \
-                data[0].lstrip('['),\
-                data[1].rstrip(':'), \
-                data[-2].split(':')[1].split('.')[0], \
-                data[-3].split(':')[1].rstrip(','), \
-                data[-2].split(':')[1].split('.')[-1].rstrip(','),\
-                data[-1].split(':')[1].rstrip('}')
-            _d = dict({'task_id':task_id, 'task_name':task_name,
-                       'queue':q, 'inq':"{} {}".format(date, ts),
-                       'received':None, 'duration':None, 'outq':None,
-                       'latency':None, 'retries':retries
-                       })
-            if task_id in _tmp_lines:
-                for k in _d:
-                    if _d[k] != _tmp_lines[task_id][k] and _d[k]:
-                        _tmp_lines[task_id][k] = _d[k]
-            else:
-                # add to dict
-                _tmp_lines[task_id] = _d
-        if mt_rx:
-            data = line.rstrip('\n').split(sep)
-            date, ts, q, task_id, task_name, retries = \
-                data[0].lstrip('['), \
-                data[1].rstrip(':'), \
-                data[-2].split(':')[1].split('.')[0], \
-                data[-3].split(':')[1].rstrip(','), \
-                data[-2].split(':')[1].split('.')[-1].rstrip(','),\
-                0
-
-            _d = dict({'task_id':task_id, 'task_name':task_name,
-                       'queue':q, 'inq':None,
-                       'received':"{} {}".format(date, ts),
-                       'duration': 0,
-                       'outq':None,
-                       'latency': 0, 'retries':retries})
-
-            if task_id in _tmp_lines:
-                _tmp_lines[task_id]['received'] = _d['received']
-
-                if _tmp_lines[task_id]['inq']:
-                    in_time_str = _tmp_lines[task_id]['inq']
-                    o_time_str = _d['received']
-                    in_time = time.mktime(time.strptime(in_time_str.split(',')[0],
-                                                        "%Y-%m-%d %H:%M:%S")) + \
-                        float('0.%s'%in_time_str.split(',')[1])
-                    o_time = time.mktime(time.strptime(o_time_str.split(',')[0],
-                                                       "%Y-%m-%d %H:%M:%S")) + \
-                        float('0.%s'%o_time_str.split(',')[1])
-                    _tmp_lines[task_id]['duration'] = _d['duration'] = o_time - in_time
-            else:
-                # add to dict
-                _tmp_lines[task_id] = _d
-        if mt_accept:
-            data = line.rstrip('\n').split(sep)
-            date, ts, q, task_id, task_name, retries = \
-                data[0].lstrip('['), \
-                data[1].rstrip(':'), \
-                data[-1].split(':')[1].split('.')[0], \
-                data[-2].split(':')[1].rstrip(','), \
-                data[-1].split(':')[1].split('.')[-1].rstrip('}'),\
-                0
-
-            _d = dict({'task_id':task_id, 'task_name':task_name,
-                       'queue':q, 'inq':None, 'received':None,
-                       'duration': 0,
-                       'outq':"{} {}".format(date, ts),
-                       'latency': 0, 'retries':retries})
-
-            if task_id in _tmp_lines:
-                _tmp_lines[task_id]['outq'] = _d['outq']
-
-                if _tmp_lines[task_id]['received']:
-                    in_time_str = _tmp_lines[task_id]['received']
-                    o_time_str = _d['outq']
-                    in_time = time.mktime(time.strptime(in_time_str.split(',')[0],
-                                                        "%Y-%m-%d %H:%M:%S")) + \
-                        float('0.%s'%in_time_str.split(',')[1])
-                    o_time = time.mktime(time.strptime(o_time_str.split(',')[0],
-                                                       "%Y-%m-%d %H:%M:%S")) + \
-                        float('0.%s'%o_time_str.split(',')[1])
-                    _tmp_lines[task_id]['latency'] = _d['latency'] = o_time - in_time
-                # output the data and remove the item
-                self._write_out(_tmp_lines[task_id])
-                _tmp_lines.pop(task_id)
-            else:
-                # add to dict
-                _tmp_lines[task_id] = _d
-
-    def _queue(self, line, o_data):
-        self._collect_in_queue_lines(line, o_data)
-
-    def _worker(self, line, out_lines=None, pattern="spends", sep=' '):
-        start_pattern = re.compile("starts executing")
-        end_pattern = re.compile(pattern)
-        end_mt = end_pattern.search(line)
-        start_mt = start_pattern.search(line)
-        if start_mt:
-            data = line.rstrip('\n').split(sep)
-            start, q, task_id, task_name, retries \
-                = \
-                "{} {}".format(data[0].lstrip('['), data[1].rstrip(':')), \
-                data[9].split(':')[1].split('.')[0], \
-                data[8].split(':')[1].rstrip(','), \
-                data[9].split(':')[1].split('.')[-1].rstrip(','), \
-                data[-1].split(':')[1].rstrip('}')
-
-            _d = {'start': start, 'end': None, 'queue':q, 'task_id':task_id,
-                  'task_name': task_name, 'duration': None, 'retries': retries}
-            out_lines[task_id] = _d
-        if end_mt:
-            data = line.rstrip('\n').split(sep)
-            end, q, task_id, task_name, tv, retries\
-                = \
-                "{} {}".format(data[0].lstrip('['), data[1].rstrip(':')),\
-                data[11].split(':')[1].split('.')[0],\
-                data[10].split(':')[1].rstrip(','), \
-                data[11].split(':')[1].split('.')[-1].rstrip(','),\
-                data[6], \
-                data[-1].split(':')[1].rstrip('}')
-            if task_id in out_lines:
-                out_lines[task_id]['end'] = end
-                out_lines[task_id]['duration'] = tv
-                self._write_out(out_lines[task_id])
-                out_lines.pop(task_id)
-                #wd = {self._csv_execution_fields[i]:data_new[i] for i in xrange(len(data_new))}
-            else:
-                out_lines[task_id] = {'start': None, 'end': end, 'queue':q, 'task_id':task_id,
-                  'task_name': task_name, 'duration': tv, 'retries': retries}
     @timing
     def _build_report(self):
         """
-        out_data = {
+        Stream the log once and feed every event to the reports
+        report.pending = {
         'task_id': {'task_id':xxx, 'task_name':xxxx}
         }
         """
-
-        func = getattr(self, "_%s"%self._data)
-        out_data = OrderedDict()
-        try:
-            with open(self._log, 'r') as f:
-                for l in f:
-                    try:
-                        func(l, out_data)
-                    except Exception as e:
-                         print("build report failed for {}".format(e))
-                         raise
-        except IOError as e:
-            print("Open file:{} error {}".format(self._log, e))
-            raise
-        # The remainders are not completed tasks or error retries, Just ingnore
-        #for v in out_data.values():
-        #    self._write_out(v)
-        self._csv_fd.close()
+        if self._jobs > 1 and not self._nodes:
+            self._parse_parallel()
+        else:
+            self._parse(self._dispatch(self._reports))
+        if self._store is not None:
+            self._store.close()
+        # The remainders are not completed tasks or error retries
+        for report in self._reports:
+            for record in report.pending.itervalues():
+                report.spill('unfinished', record)
+            report.pending.clear()
+            report.close()
         if self._kwargs.get('html'):
-            self.create_html_report()
+            for report in self._reports:
+                self.create_html_report(report)
+        if self._kwargs.get('plot'):
+            for report in self._reports:
+                print("Plot Generated:\n\t{}".format(self.draw_duration_plot(
+                    report.out_file, points=self._kwargs.get('points') or 2000,
+                    downsample=self._kwargs.get('downsample') or 'lttb',
+                    fmt=self._kwargs['plot'])))
+
     @timing
     def read_csv_report(self, csv, idx, num, asc=False, bar_len=0):
         csv = self._kwargs['report'] or csv
+        if self._kwargs.get('stream'):
+            for by, table in sketch_percentiles(csv).items():
+                self._print_percentiles(by, table, bar_len)
+            self._print_amplification(iter_report(csv), bar_len)
+            return
         #df = pd.read_csv(os.path.join(self._report_dir, csv))
-        df = pd.read_csv(csv)
+        df = load_report(csv)
+        if idx != 'index' and idx not in df:
+            # e.g. the default duration of a lifecycle or retry report
+            idx = (value_columns(df) or ['index'])[0]
         if idx == 'index':
-            print df.sort(ascending=asc).head(num)
+            print df.sort_index(ascending=asc).head(num)
         else:
-            print df.sort(idx, ascending=asc).head(num)
+            print df.sort_values(idx, ascending=asc).head(num)
         print bar_len*"="
         print "%80s"%"Statistic Info"
         print bar_len*"="
         print df.describe()
         print bar_len*"="
         print df.task_name.describe()
+        for by in PERCENTILE_GROUPS:
+            self._print_percentiles(by, percentiles(df, by), bar_len)
+        self._print_amplification([df], bar_len)
 
+    def _print_percentiles(self, by, table, bar_len=0):
+        print bar_len*"="
+        print "%80s"%"Percentiles by {}".format(by)
+        print bar_len*"="
+        print table.to_string()
 
-    def create_html_report(self):
-        pf = pd.read_csv(self._out_file)
-        self.html_report = os.path.join(self._report_dir,
-                                        os.path.basename(self.html_report))
+    def _print_amplification(self, frames, bar_len=0):
+        frames = iter(frames)
+        first = next(frames, None)
+        if first is None or 'retry_lost' not in first:
+            return
+        print bar_len*"="
+        print "%80s"%"Retry amplification by task_name"
+        print bar_len*"="
+        print amplification(chain([first], frames)).to_string()
+
+
+    def create_html_report(self, report):
+        """
+        Create the summary page of the report instead of the whole rows:
+        the percentiles by task_name and queue, the throughput over time,
+        the slowest tasks and the downsampled charts. At most html_rows
+        rows are written to every table.
+        """
+        pf = load_report(report.out_file)
+        rows = self._kwargs.get('html_rows') or 100
+        # the timestamp completes a row, end, outq or done
+        epochs = decoder.decode_many(pf[self._builders[report.name].ts_fields[-1]].values)
+        sections = ["<p>{} rows of {}</p>".format(len(pf), report.out_file)]
+
+        for by in PERCENTILE_GROUPS:
+            sections.append("<h2>Percentiles by {}</h2>".format(by))
+            sections.append(percentiles(pf, by).to_html(float_format='%.3f'))
+
+        rate = throughput(epochs, pf.queue.values, rows)
+        sections.append("<h2>Throughput</h2>")
+        x = rate.index.values.astype('datetime64[s]').astype(float)
+        sections.append(_chart([(q, x, rate[q].values) for q in rate],
+                               'tasks {}'.format(rate.index.name), 'tasks'))
+        sections.append(rate.to_html())
+
+        for c in value_columns(pf):
+            order = np.argsort(epochs, kind='mergesort')
+            x, y = minmax_downsample(epochs[order], pf[c].values[order], 1000)
+            sections.append("<h2>{}</h2>".format(c))
+            sections.append(_chart([(c, x, y)],
+                                   c, 'seconds'))
+
+        top = [c for c in self._builders[report.name].top if c in pf]
+        if top:
+            rank = pf[top].max(axis=1)
+            sections.append("<h2>Top {} by {}</h2>".format(rows, ', '.join(top)))
+            sections.append(pf.loc[rank.nlargest(rows).index].to_html(index=False))
         try:
-            with open(self.html_report, 'wb') as f:
-                f.writelines(pf.to_html())
+            with open(report.html_report, 'wb') as f:
+                f.write(HTML_REPORT.format(title=os.path.basename(report.out_file),
+                                           sections='\n'.join(sections)))
         except IOError:
             raise
 
-    def draw_duration_plot(self):
-        pass
+    def draw_duration_plot(self, report, out_file=None, points=2000,
+                           downsample='lttb', fmt='png'):
+        """
+        Draw the seconds columns and the retries series of the report
+        over the completion time of the rows into a png or svg figure,
+        every series is downsampled to at most points points.
+        @report: the report of any type
+        @out_file: the figure, default the report with the fmt suffix
+        @downsample: the downsampler[lttb|minmax]
+        """
+        if plt is None:
+            raise ImportError("matplotlib is required to draw the plot")
+        pf = load_report(report)
+        ts = [b.ts_fields[-1] for b in self._builders.values()
+              if tuple(pf.columns) == b.header][0]
+        epochs = decoder.decode_many(pf[ts].values)
+        order = np.argsort(epochs, kind='mergesort')
+        epochs = epochs[order]
+        columns = value_columns(pf) + ['retries']
+        fig, axes = plt.subplots(len(columns), 1, sharex=True, squeeze=False,
+                                 figsize=(12, 3 * len(columns)))
+        try:
+            for ax, c in zip(axes[:, 0], columns):
+                x, y = DOWNSAMPLERS[downsample](epochs, pf[c].values[order],
+                                                points)
+                ax.plot(mdates.epoch2num(x), y, linewidth=0.6)
+                ax.set_ylabel(c)
+                _date_axis(ax)
+            axes[0, 0].set_title("{} ({} rows, {} points {})".format(
+                os.path.basename(report), len(pf), points, downsample))
+            out_file = out_file or "{}.{}".format(os.path.splitext(report)[0], fmt)
+            fig.savefig(out_file, format=fmt, dpi=100, bbox_inches='tight')
+        finally:
+            plt.close(fig)
+        return out_file
+
+    def detect_stalls(self, report, bucket=1.0, min_waiting=1, min_idle=1,
+                      min_stall=0.5, num=50):
+        """
+        Write the pool_timeline of the pool report to
+        <report>_timeline.csv, print the utilization of the pool
+        processes and the longest stall windows.
+        """
+        timeline, procs = pool_timeline(load_report(report), bucket,
+                                        min_waiting, min_idle, min_stall)
+        windows = stall_windows(timeline, bucket)
+        out_file = "{}_timeline.csv".format(os.path.splitext(report)[0])
+        timeline.to_csv(out_file, float_format='%.3f')
+        print("%80s"%"Utilization by worker")
+        print(timeline.groupby('worker')[['procs', 'busy', 'idle', 'reserved',
+                                          'queued', 'stalled', 'utilization']].mean()
+              .to_string(float_format='{:.3f}'.format))
+        print("%80s"%"Utilization by pool process")
+        print(procs[['worker', 'tasks', 'busy', 'utilization']]
+              .to_string(float_format='{:.3f}'.format))
+        print("%80s"%"Stall windows")
+        print(windows.head(num).to_string(index=False,
+                                          float_format='{:.3f}'.format))
+        print("{} stall windows, {:.0f} seconds stalled, timeline: {}".format(
+            len(windows), windows.seconds.sum(), out_file))
+        return out_file
+
+    def break_down_waits(self, report, bucket=60.0, num=50):
+        """
+        Write the consumer_waits by bucket of the consumer report to
+        <report>_buckets.csv and print the waits by consumer pid.
+        """
+        by_pid, by_bucket = consumer_waits(load_report(report), bucket)
+        out_file = "{}_buckets.csv".format(os.path.splitext(report)[0])
+        by_bucket.to_csv(out_file, float_format='%.3f')
+        print("%80s"%"Waits by consumer pid")
+        print(by_pid.head(num).to_string(float_format='{:.3f}'.format))
+        print("{} buckets of {:g} seconds: {}".format(
+            len(by_bucket.index.levels[0]), bucket, out_file))
+        return out_file
 
     def run(self):
         try:
             print("Starts analyzing...")
+            if self._nodes:
+                print('\n'.join("\t{}: {}".format(n, ', '.join(logs))
+                                 for n, logs in self._nodes))
+            elif len(self._logs) > 1:
+                print('\n'.join("\t{}".format(l) for l in self._logs))
             b = time.time()
             self._build_report()
             spends = time.time() - b
-            reports = (self._out_file, self.html_report) \
-                if self._kwargs.get('html') \
-                else (self._out_file, 'Not create html report')
-            print ("Report Generated:\n\t{1}\n\t{2}"\
-                   .format(spends, reports[0], reports[1]))
+            print("Report Generated:")
+            for report in self._reports:
+                print("\t{}\n\t{}".format(report.out_file,
+                    report.html_report if self._kwargs.get('html') \
+                    else 'Not create html report'))
+                if report.orphans:
+                    print("\t{}".format(report.orphans))
+            for report in self._reports:
+                print("{} pending records: {} expired, {} evicted, "
+                      "{} unfinished".format(report.name,
+                          report.spilled['expired'],
+                          report.spilled['evicted'],
+                          report.spilled['unfinished']))
+            if self._store is not None:
+                print("{} events loaded into {}".format(self._store.count,
+                                                        self._store.path))
+            for node, _ in self._nodes:
+                print("{} clock offset: {:+.3f} seconds".format(
+                    node, self._offsets.get(node, 0.0)))
         except:
             raise
 
@@ -322,17 +2295,75 @@ def main():
     parser.add_option('-b', action='store_true', dest='browser',
                       default=False, help='Open report in browser or not')
     parser.add_option('-d', '--data', type="string", dest="data", default='worker',
-                      help="config which data to analyze[worker|queue]")
+                      help="config which data to analyze"
+                           "[worker|queue|lifecycle|retry|pool|consumer|all]")
+    parser.add_option('-f', '--format', type="string", dest="type", default='csv',
+                      help="the report type[csv|parquet|feather|npy]")
     parser.add_option('-w', action='store_true', dest='html',
                       default=False, help='create html webpage report')
+    parser.add_option('--html-rows', type="int", dest="html_rows", default=100,
+                      help='the max rows of every table of the html report')
+    parser.add_option('-p', '--plot', type="string", dest="plot", default=None,
+                      help='draw the plot of the reports in the format[png|svg]')
+    parser.add_option('--points', type="int", dest="points", default=2000,
+                      help='the max points of every series of the plot')
+    parser.add_option('--downsample', type="string", dest="downsample", default='lttb',
+                      help='the downsampler of the plot series[lttb|minmax]')
+    parser.add_option('-j', '--jobs', type="int", dest="jobs", default=1,
+                      help="the number of processes to parse the log, 0 for all cores")
+    parser.add_option('--chunk-size', type="int", dest="chunk_size", default=32,
+                      help="the MB of log every process parses at a time")
     parser.add_option('-i', '--index', type='string', dest='idx', default='duration',
                       help='display by which index[duration, latency]')
     parser.add_option('-l', '--log', type='string', dest='log', default='celery.log',
                       help='the log name which will be analyzed')
     parser.add_option('-n', '--number', type="int", dest="number", default=50,
-                      help="config the number of records to show")
+                      help="config the number of records to show, 0 for all the events of query")
     parser.add_option('-r', '--report', type='string', dest='report', default='celery.csv',
-                      help='the csv report to read')
+                      help='the report to read[.csv|.parquet|.feather|.npy]')
+    parser.add_option('-c', '--checkpoint', type='string', dest='checkpoint', default=None,
+                      help='the checkpoint file of follow, default reports/<log>.checkpoint')
+    parser.add_option('-t', '--interval', type='float', dest='interval', default=1.0,
+                      help='the seconds follow waits for the new lines')
+    parser.add_option('--max-pending', type='int', dest='max_pending', default=None,
+                      help='the max number of pending records of a report')
+    parser.add_option('--pending-ttl', type='float', dest='pending_ttl', default=None,
+                      help='the max seconds of log time a record waits for its partner lines')
+    parser.add_option('-o', '--orphans', action='store_true', dest='orphans', default=False,
+                      help='write the evicted and uncompleted records to <report>_orphans.csv')
+    parser.add_option('-s', '--stream', action='store_true', dest='stream', default=False,
+                      help='read only the percentiles in one bounded memory pass')
+    parser.add_option('--db', type='string', dest='db', default=None,
+                      help='the sqlite database build loads the events into and query '
+                           'reads, default reports/<log>.db of query')
+    parser.add_option('--task-id', type='string', dest='task_id', default=None,
+                      help='query the events of the task_id')
+    parser.add_option('--task-name', type='string', dest='task_name', default=None,
+                      help='query the events of the task_name, the last part of the task name')
+    parser.add_option('--pid', type='string', dest='pid', default=None,
+                      help='query the events of the pid')
+    parser.add_option('--kind', type='string', dest='kind', default=None,
+                      help='query the events of the kind[{}]'.format('|'.join(classifier.kinds)))
+    parser.add_option('--begin', type='string', dest='begin', default=None,
+                      help='query the events from the time, e.g. "2015-04-14 10:02"')
+    parser.add_option('--end', type='string', dest='end', default=None,
+                      help='query the events before the time, e.g. "2015-04-14 10:05"')
+    parser.add_option('--bucket', type='float', dest='bucket', default=None,
+                      help='the seconds of every bucket of the stall timeline, '
+                           'default 1, and of the waits, default 60')
+    parser.add_option('--min-waiting', type='int', dest='min_waiting', default=1,
+                      help='the waiting tasks of a stalled moment')
+    parser.add_option('--min-idle', type='int', dest='min_idle', default=1,
+                      help='the idle pool processes of a stalled moment')
+    parser.add_option('--min-stall', type='float', dest='min_stall', default=0.5,
+                      help='the fraction of a stalled bucket that is stalled')
+    parser.add_option('-N', '--nodes', type='string', dest='nodes', default=None,
+                      help='the logs of the nodes to merge, seperate in comma, '
+                           'e.g. node1/task.log,node2/task.log')
+    parser.add_option('--no-skew', action='store_false', dest='skew', default=True,
+                      help='do not correct the clock offsets of the nodes')
+    parser.add_option('-R', '--rotated', action='store_true', dest='rotated', default=False,
+                      help='analyze the rotation set of the log, log.N[.gz] ... log.1, log')
 
 
     options, args = parser.parse_args()
@@ -349,10 +2380,71 @@ def main():
 
     try:
         if cmd == 'build':
-            analyzer = Analyzer(options.data, options.log, html=options.html)
+            jobs = options.jobs if options.jobs > 0 \
+                else multiprocessing.cpu_count()
+            analyzer = Analyzer(options.data, options.log, options.type,
+                                html=options.html, html_rows=options.html_rows,
+                                plot=options.plot, points=options.points,
+                                downsample=options.downsample, db=options.db,
+                                nodes=options.nodes and options.nodes.split(','),
+                                skew=options.skew,
+                                jobs=jobs, chunk_size=options.chunk_size,
+                                rotated=options.rotated,
+                                max_pending=options.max_pending,
+                                pending_ttl=options.pending_ttl,
+                                orphans=options.orphans)
             analyzer.run()
-        else:
+        elif cmd == 'follow':
+            analyzer = Analyzer(options.data, options.log, follow=True,
+                                checkpoint=options.checkpoint,
+                                max_pending=options.max_pending,
+                                pending_ttl=options.pending_ttl,
+                                orphans=options.orphans)
+            print("Starts following {}...".format(options.log))
+            analyzer.follow(options.interval)
+        elif cmd == 'query':
+            db = options.db or os.path.join("reports", "{}.db".format(
+                os.path.basename(options.log).split(".")[0]))
+            try:
+                store = EventStore(db, readonly=True)
+            except IOError as e:
+                print("Error: {}".format(e))
+                return 1
+            try:
+                # one more event tells if the limit left out any
+                events = store.query(options.task_id, options.task_name,
+                                     options.pid, options.kind, options.begin,
+                                     options.end,
+                                     options.number and options.number + 1)
+            finally:
+                store.close()
+            truncated = options.number and len(events) > options.number
+            if truncated:
+                events = events[:options.number]
+            print(events.to_string(index=False, float_format='{:.3f}'.format))
+            if truncated:
+                print("The first {} events of {}, more are left out, "
+                      "see -n(0 for all)".format(len(events), db))
+            else:
+                print("{} events of {}".format(len(events), db))
+            return 0
+        elif cmd == 'stall':
+            analyzer = Analyzer(report=options.report)
+            analyzer.detect_stalls(options.report, options.bucket or 1.0,
+                                   options.min_waiting, options.min_idle,
+                                   options.min_stall,
+                                   options.number)
+        elif cmd == 'waits':
+            analyzer = Analyzer(report=options.report)
+            analyzer.break_down_waits(options.report, options.bucket or 60.0,
+                                      options.number)
+        elif cmd == 'plot':
             analyzer = Analyzer(report=options.report)
+            print("Plot Generated:\n\t{}".format(analyzer.draw_duration_plot(
+                options.report, points=options.points,
+                downsample=options.downsample, fmt=options.plot or 'png')))
+        else:
+            analyzer = Analyzer(report=options.report, stream=options.stream)
             print("Starts reading report...")
             BAR_LEN = 195 if 'queue' in options.report\
                  else 145 if options.data == 'worker' \
@@ -367,9 +2459,11 @@ def main():
             #analyzer.draw_duration_plot()
             print BAR_LEN*"="
         if options.browser:
-            webbrowser.open(analyzer.report)
+            for report in analyzer.reports:
+                webbrowser.open(report.html_report)
     except Exception as e:
         print("analyzing failed! Reason: {}".format(e))
+        return 1
 
 if __name__ == '__main__':
     sys.exit(main())
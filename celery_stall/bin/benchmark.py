@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import re
+import sys
+import time
+import uuid
+import random
+import shutil
+import tempfile
+import subprocess
+import logging
+
+from optparse import OptionParser
+from collections import OrderedDict
+
+from analysis import classifier, rotation_set, _open_log
+from loggen import TraceLogGenerator, RotatingLog
+from capture import CaptureWriter, CaptureReader
+
+Commands = ("classifier", "analyzer", "replay")
+
+# the events/s the aggregating replay with the latency is expected to
+# keep up with
+REPLAY_TARGET = 100000
+
+# the analyzer modes benchmarked: the analysis.py arguments of the mode,
+# {log} is the log and {rotated} is -R if the log is rotated. read and
+# stream read the report built by the modes before them.
+ANALYZER_MODES = OrderedDict([
+    ('worker', ['build', '-l', '{log}', '-d', 'worker', '{rotated}']),
+    ('lifecycle', ['build', '-l', '{log}', '-d', 'lifecycle', '{rotated}']),
+    ('all', ['build', '-l', '{log}', '-d', 'all', '{rotated}']),
+    ('jobs', ['build', '-l', '{log}', '-d', 'all', '-j', '0', '{rotated}']),
+    ('parquet', ['build', '-l', '{log}', '-d', 'all', '-f', 'parquet', '{rotated}']),
+    ('db', ['build', '-l', '{log}', '-d', 'worker', '--db', 'events.db', '{rotated}']),
+    ('read', ['read', '-r', 'reports/{name}.csv']),
+    ('stream', ['read', '-s', '-r', 'reports/{name}.csv']),
+])
+
+USAGE = """
+%prog <command> [options]
+Commands:
+""" + '\n'.join(["%10s: " % x for x in Commands])
+
+
+def legacy_classify(line, sep=' '):
+    """
+    The line matching of analysis.py before the TraceClassifier, every
+    pattern is compiled and searched for every line.
+    """
+    prog_tx = re.compile("publishing")
+    prog_rx = re.compile("(anan)+.*Received")
+    prog_accept = re.compile("(anan)+.*task-accepted")
+    start_pattern = re.compile("starts executing")
+    end_pattern = re.compile("spends")
+    mt_tx = prog_tx.search(line)
+    mt_rx = prog_rx.search(line)
+    mt_accept = prog_accept.search(line)
+    start_mt = start_pattern.search(line)
+    end_mt = end_pattern.search(line)
+    if mt_tx or mt_rx or mt_accept:
+        data = line.rstrip('\n').split(sep)
+        return data[0].lstrip('['), data[1].rstrip(':'), data[-3], data[-2]
+    if start_mt:
+        data = line.rstrip('\n').split(sep)
+        return data[0].lstrip('['), data[1].rstrip(':'), data[8], data[9]
+    if end_mt:
+        data = line.rstrip('\n').split(sep)
+        return data[0].lstrip('['), data[1].rstrip(':'), data[10], data[11], data[6]
+    return None
+
+
+def _scan(log, func):
+    lines = matched = 0
+    b = time.time()
+    with open(log, 'r') as f:
+        for l in f:
+            lines += 1
+            if func(l) is not None:
+                matched += 1
+    return lines, matched, time.time() - b
+
+
+def bench_classifier(log, rounds=1):
+    print("{:>12} {:>10} {:>10} {:>10} {:>14}".format(
+        'parser', 'lines', 'events', 'seconds', 'lines/s'))
+    result = {}
+    for name, func in (('legacy', legacy_classify),
+                       ('classifier', classifier.classify)):
+        best = None
+        for _ in xrange(rounds):
+            r = _scan(log, func)
+            if best is None or r[2] < best[2]:
+                best = r
+        lines, matched, spends = best
+        result[name] = lines / spends if spends else 0
+        print("{:>12} {:>10} {:>10} {:>10.3f} {:>14.0f}".format(
+            name, lines, matched, spends, result[name]))
+    if result['legacy']:
+        print("speedup: {:.1f}x".format(result['classifier'] / result['legacy']))
+    return result
+
+
+def _count_lines(logs):
+    lines = 0
+    for log in logs:
+        with _open_log(log) as f:
+            for _ in f:
+                lines += 1
+    return lines
+
+
+def _run(args, cwd):
+    """
+    Run a command, returns its wall seconds, the peak RSS in MB of its
+    process(the processes it waited for included) and its exit status
+    """
+    with open(os.devnull, 'w') as null:
+        b = time.time()
+        p = subprocess.Popen(args, cwd=cwd, stdout=null, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(p.pid, 0)
+        spends = time.time() - b
+    status = os.WEXITSTATUS(status) if os.WIFEXITED(status) \
+        else -os.WTERMSIG(status)
+    return spends, usage.ru_maxrss / 1024.0, status
+
+
+def generate_log(log, tasks, rotate_mb=0, compress=False, record=False, seed=1):
+    """
+    Write a synthetic log of the tasks by loggen, see TraceLogGenerator
+    """
+    out = RotatingLog(log, int(rotate_mb * (1 << 20)), compress=compress)
+    try:
+        TraceLogGenerator(tasks, record=record, seed=seed).generate(out)
+    finally:
+        out.close()
+    return out.lines
+
+
+def bench_analyzer(log, modes=None, rounds=1, rotated=False):
+    """
+    Run analysis.py in every mode on the log in a scratch directory,
+    report the best wall time of the rounds, its lines/s and the peak
+    RSS of the analyzer.
+    """
+    log = os.path.abspath(log)
+    logs = rotation_set(log) if rotated else [log]
+    lines = _count_lines(logs)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'analysis.py')
+    name = os.path.basename(log).split(".")[0]
+    print("{} lines of {}".format(lines, ', '.join(logs)))
+    print("{:>10} {:>10} {:>14} {:>10} {:>7}".format(
+        'mode', 'seconds', 'lines/s', 'rss MB', 'status'))
+    result = OrderedDict()
+    cwd = tempfile.mkdtemp(prefix='benchmark-')
+    try:
+        for mode in modes or ANALYZER_MODES:
+            args = [a.format(log=log, name=name, rotated='-R' if rotated else '')
+                    for a in ANALYZER_MODES[mode]]
+            args = [sys.executable, script] + [a for a in args if a]
+            best = None
+            for _ in xrange(rounds):
+                r = _run(args, cwd)
+                if best is None or r[0] < best[0]:
+                    best = r
+            spends, rss, status = best
+            result[mode] = (spends, lines / spends if spends else 0, rss)
+            print("{:>10} {:>10.3f} {:>14.0f} {:>10.1f} {:>7}".format(
+                mode, spends, result[mode][1], rss, status))
+    finally:
+        shutil.rmtree(cwd)
+    return result
+
+
+def generate_capture(path, tasks, names=10, rate=1000.0, seed=1):
+    """
+    Write a capture of the tasks sent, received, started and succeeded
+    at the rate of tasks/s, a task of one of the names, returns the
+    number of the events
+    """
+    rnd = random.Random(seed)
+    names = ['bench.task{}'.format(i) for i in xrange(names)]
+    writer = CaptureWriter(path, sync_interval=3600.0)
+    now = 1500000000.0
+    try:
+        for _ in xrange(tasks):
+            now += rnd.expovariate(rate)
+            task_id, name = str(uuid.UUID(int=rnd.getrandbits(128))), rnd.choice(names)
+            ts = now
+            for kind in ('task-sent', 'task-received', 'task-started', 'task-succeeded'):
+                ts += rnd.expovariate(1000.0)
+                event = {'type': kind, 'uuid': task_id, 'timestamp': ts,
+                         'hostname': 'celery@bench'}
+                if kind in ('task-sent', 'task-received'):
+                    event['name'] = name
+                writer.write(event, ts)
+    finally:
+        writer.close()
+    return writer.events
+
+
+def bench_replay(capture, rounds=1):
+    """
+    Replay the capture by the aggregating Monitor with the LatencyStat,
+    report the best events/s of the rounds against REPLAY_TARGET
+    """
+    from celery import Celery
+    from monitor import Monitor, Stat, LatencyStat
+    logger = logging.getLogger('benchmark.replay')
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    cwd = tempfile.mkdtemp(prefix='benchmark-')
+    best = None
+    try:
+        for _ in xrange(rounds):
+            reader = CaptureReader(capture)
+            monitor = Monitor(Celery(), logger, aggregate=True,
+                              stat=Stat(os.path.join(cwd, 'report.csv'), 10),
+                              latency=LatencyStat(os.path.join(cwd, 'latency.csv'), 60),
+                              state_interval=1e9)
+            events = sum(1 for _ in reader.events())
+            b = time.time()
+            monitor.replay(reader)
+            spends = time.time() - b
+            if best is None or spends < best[1]:
+                best = events, spends
+    finally:
+        shutil.rmtree(cwd)
+    events, spends = best
+    rate = events / spends if spends else 0
+    print("{:>10} {:>10} {:>10} {:>14} {:>10}".format(
+        'mode', 'events', 'seconds', 'events/s', 'target'))
+    print("{:>10} {:>10} {:>10.3f} {:>14.0f} {:>10}".format(
+        'latency', events, spends, rate,
+        'met' if rate >= REPLAY_TARGET else 'missed'))
+    return rate
+
+
+def main():
+
+    parser = OptionParser(USAGE)
+    parser.add_option('-c', '--count', type="int", dest="count", default=3,
+                      help='The rounds of each benchmark, the best is reported')
+    parser.add_option('-l', '--log', type='string', dest='log', default='task.log',
+                      help='the log to benchmark with')
+    parser.add_option('-m', '--modes', type='string', dest='modes', default=None,
+                      help='the analyzer modes to benchmark, seperate in comma[{}]'
+                           .format('|'.join(ANALYZER_MODES)))
+    parser.add_option('-R', '--rotated', action='store_true', dest='rotated', default=False,
+                      help='benchmark the rotation set of the log')
+    parser.add_option('-g', '--generate', type='int', dest='generate', default=0,
+                      help='write a synthetic log of the number of tasks to the log first')
+    parser.add_option('--rotate-mb', type='float', dest='rotate_mb', default=0,
+                      help='roll the generated log over every MB, the rotation set is analyzed')
+    parser.add_option('--gzip', action='store_true', dest='gzip', default=False,
+                      help='gzip the rolled over members of the generated log')
+    parser.add_option('--record', action='store_true', dest='record', default=False,
+                      help='generate the fixed field records of ANAN_TRACE=record')
+    parser.add_option('--capture', type='string', dest='capture', default='events.cap',
+                      help='the capture to benchmark the replay with, generated by -g')
+
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.print_help()
+        print "Error: config the command"
+        return 1
+
+    cmd = args[0]
+    if cmd not in Commands:
+        parser.print_help()
+        print "Error: Unkown command: ", cmd
+        return 1
+
+    if options.generate and cmd == 'replay':
+        if os.path.exists(options.capture):
+            os.remove(options.capture)
+        b = time.time()
+        events = generate_capture(options.capture, options.generate)
+        print("{} events generated in {:.3f} seconds".format(events, time.time() - b))
+    elif options.generate:
+        b = time.time()
+        lines = generate_log(options.log, options.generate, options.rotate_mb,
+                             options.gzip, options.record)
+        print("{} lines generated in {:.3f} seconds".format(lines, time.time() - b))
+
+    if cmd == 'classifier':
+        bench_classifier(options.log, options.count)
+    elif cmd == 'analyzer':
+        modes = options.modes and options.modes.split(',')
+        bench_analyzer(options.log, modes, options.count,
+                       rotated=options.rotated or bool(options.rotate_mb))
+    elif cmd == 'replay':
+        bench_replay(options.capture, options.count)
+
+if __name__ == '__main__':
+    sys.exit(main())
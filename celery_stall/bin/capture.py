@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import time
+import zlib
+import struct
+import marshal
+import threading
+
+from collections import deque
+
+# the capture file of the celery events:
+#   MAGIC, then blocks of
+#   SYNC, block header, the records of the block(compressed if zlib)
+# and a record is
+#   record header, the task uuid, the marshal dump of the event
+# The SYNC marker of every block lets the reader skip a torn or corrupt
+# block, e.g. the last block of a capture killed while writing.
+MAGIC = 'CELERYCAP\x01'
+SYNC = '\xa7\x3c\x51\xe8CAPSYNC\x00\x9b\x12\xd4'
+# events, raw size, stored size, crc32 of the stored, flags, first and
+# last receive time
+BLOCK_HEADER = struct.Struct('<IIIiBdd')
+# payload size, event kind, receive time, uuid size
+RECORD_HEADER = struct.Struct('<IBdB')
+
+# the flags of a block
+FLAG_ZLIB = 1
+
+# the codes of the event types in the record header, 0 for the others
+EVENT_KINDS = ('task-sent', 'task-received', 'task-started', 'task-succeeded',
+               'task-failed', 'task-retried', 'task-revoked',
+               'worker-online', 'worker-heartbeat', 'worker-offline')
+KIND_CODES = dict((k, i + 1) for i, k in enumerate(EVENT_KINDS))
+
+
+class CaptureWriter(object):
+    """
+    CaptureWriter
+    Append the events to a capture file, an event is only dumped by
+    marshal into the buffer of the block, the block is compressed and
+    written when it is block_size bytes or sync_interval seconds old.
+    A thread of the writer flushes the block sync_interval seconds after
+    its first event if no event comes to flush it.
+    @path: the capture file, appended if exists
+    @compress: zlib the blocks
+    @block_size: the raw bytes of a block
+    @sync_interval: the max seconds an event is buffered
+    @level: the zlib level
+    """
+
+    def __init__(self, path, compress=True, block_size=1 << 16, sync_interval=1.0,
+                 level=1):
+        super(CaptureWriter, self).__init__()
+        self.path = path
+        self.compress = compress
+        self.block_size = block_size
+        self.sync_interval = sync_interval
+        self.level = level
+        self._fd = open(path, 'ab')
+        if not self._fd.tell():
+            self._fd.write(MAGIC)
+        self._buf = []
+        self._size = 0
+        self._first = None
+        self._last = None
+        # the time the first event of the block is buffered
+        self._started = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.events = 0
+        self.blocks = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self._timer = None
+        if sync_interval > 0:
+            self._timer = threading.Thread(target=self._tick, name='capture-sync')
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _tick(self):
+        """
+        Flush the block when it is sync_interval seconds old, the events
+        of a quiet stream are not held until the next event
+        """
+        while True:
+            with self._lock:
+                due = self.sync_interval
+                if self._started is not None:
+                    due += self._started - time.time()
+                    if due <= 0:
+                        self._flush()
+                        due = self.sync_interval
+            if self._stop.wait(due):
+                return
+
+    def write(self, event, now=None):
+        """
+        Buffer an event dict of the celery event receiver, at the time it
+        is received if the receiver tells
+        """
+        now = now or event.get('local_received') or time.time()
+        uuid = event.get('uuid') or ''
+        if isinstance(uuid, unicode):
+            # the events decoded by json carry unicode
+            uuid = uuid.encode('utf-8')
+        payload = marshal.dumps(event)
+        header = RECORD_HEADER.pack(len(payload), KIND_CODES.get(event.get('type'), 0),
+                                    now, len(uuid))
+        with self._lock:
+            self._buf.append(header)
+            self._buf.append(uuid)
+            self._buf.append(payload)
+            self._size += RECORD_HEADER.size + len(uuid) + len(payload)
+            if self._first is None:
+                self._first = now
+                self._started = time.time()
+            self._last = now
+            if self._size >= self.block_size or now - self._first >= self.sync_interval:
+                self._flush()
+
+    def flush(self):
+        """
+        Write the buffered events as a block
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._buf:
+            return
+        n = len(self._buf) // 3
+        raw = ''.join(self._buf)
+        flags = 0
+        data = raw
+        if self.compress:
+            data = zlib.compress(raw, self.level)
+            flags |= FLAG_ZLIB
+        self._fd.write(SYNC + BLOCK_HEADER.pack(n, len(raw), len(data), zlib.crc32(data),
+                                                flags, self._first, self._last))
+        self._fd.write(data)
+        self._fd.flush()
+        self.events += n
+        self.blocks += 1
+        self.raw_bytes += len(raw)
+        self.stored_bytes += len(data)
+        self._buf = []
+        self._size = 0
+        self._first = None
+        self._started = None
+
+    def close(self):
+        self._stop.set()
+        if self._timer is not None:
+            self._timer.join()
+        self.flush()
+        self._fd.close()
+
+    def info(self):
+        return "{} events in {} blocks, {} bytes, {} bytes stored".format(
+            self.events, self.blocks, self.raw_bytes, self.stored_bytes)
+
+
+class CaptureReader(object):
+    """
+    CaptureReader
+    Read the blocks of a capture file, a torn or corrupt block is skipped
+    to the next SYNC marker and counted in skipped.
+    @path: the capture file
+    """
+
+    def __init__(self, path):
+        super(CaptureReader, self).__init__()
+        self.path = path
+        self.skipped = 0
+
+    def _resync(self, f, offset):
+        """
+        Seek to the next SYNC marker after offset, False if none
+        """
+        f.seek(offset)
+        tail = ''
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                return False
+            data = tail + chunk
+            i = data.find(SYNC)
+            if i >= 0:
+                f.seek(f.tell() - len(data) + i)
+                return True
+            tail = data[-(len(SYNC) - 1):]
+
+    def blocks(self):
+        """
+        Yield (events, raw records, first and last receive time) of every
+        intact block
+        """
+        with open(self.path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("{} is not a capture file".format(self.path))
+            head = len(SYNC) + BLOCK_HEADER.size
+            while True:
+                offset = f.tell()
+                header = f.read(head)
+                if not header:
+                    return
+                if len(header) == head and header.startswith(SYNC):
+                    n, raw_size, size, crc, flags, first, last = \
+                        BLOCK_HEADER.unpack_from(header, len(SYNC))
+                    data = f.read(size)
+                    if len(data) == size and zlib.crc32(data) == crc:
+                        if flags & FLAG_ZLIB:
+                            data = zlib.decompress(data)
+                        if len(data) == raw_size:
+                            yield n, data, first, last
+                            continue
+                self.skipped += 1
+                if not self._resync(f, offset + 1):
+                    return
+
+    def events(self, kinds=None, names=None, max_tasks=1000000):
+        """
+        Yield (receive time, task name, event) of the events of the kinds
+        of the tasks of the names. The records are walked by their
+        headers, only the events yielded and the task-sent and
+        task-received events naming the tasks are decoded. The task name
+        is None if the naming events of the task are not captured.
+        @kinds: the event types, None for all
+        @names: the task names, None for all
+        @max_tasks: the max number of the unfinished tasks whose names are
+                    kept, the first seen ones are dropped
+        """
+        # the code -> yielded, and 1 of the events naming the tasks, 2 of
+        # the events finishing them
+        wanted = [kinds is None] * 256
+        for k in kinds or ():
+            wanted[KIND_CODES.get(k, 0)] = True
+        action = [0] * 256
+        for k in ('task-sent', 'task-received'):
+            action[KIND_CODES[k]] = 1
+        for k in ('task-succeeded', 'task-failed', 'task-revoked'):
+            action[KIND_CODES[k]] = 2
+        # uuid -> the task name, of the tasks not finished, and the uuids
+        # in the order they are named, the finished ones are skipped when
+        # the first named is dropped
+        tasks = {}
+        order = deque()
+        unpack = RECORD_HEADER.unpack_from
+        head = RECORD_HEADER.size
+        loads = marshal.loads
+        for _, data, _, _ in self.blocks():
+            offset = 0
+            end = len(data)
+            while offset < end:
+                size, code, recv, uuid_size = unpack(data, offset)
+                begin = offset + head + uuid_size
+                uuid = data[begin - uuid_size:begin]
+                offset = begin + size
+                act = action[code]
+                if act == 1:
+                    event = loads(data[begin:offset])
+                    name = event.get('name')
+                    if tasks.get(uuid) is None:
+                        tasks[uuid] = name
+                        order.append(uuid)
+                        if len(order) > max_tasks:
+                            while len(tasks) > max_tasks:
+                                tasks.pop(order.popleft(), None)
+                            if len(order) > 2 * max_tasks:
+                                order = deque(u for u in order if u in tasks)
+                    if names is not None and name not in names:
+                        continue
+                    if wanted[code]:
+                        yield recv, name, event
+                    continue
+                name = tasks.pop(uuid, None) if act == 2 else tasks.get(uuid)
+                if names is not None and name not in names:
+                    continue
+                if wanted[code]:
+                    yield recv, name, loads(data[begin:offset])
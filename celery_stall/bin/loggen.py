@@ -0,0 +1,451 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import sys
+import gzip
+import time
+import uuid
+import heapq
+import random
+import shutil
+
+from optparse import OptionParser
+
+USAGE = """
+%prog [options]
+Write a synthetic task.log of the "anan:" trace lines of the patched
+celery/billiard modules, e.g.
+%prog -n 100000 -w 4 -c 8 -r 0.1 -o task.log --max-mb 64 --gzip
+"""
+
+# the formats of the task.log handlers of the patched modules
+CELERY_LINE = "[{ts} INFO/{logger}] {msg}\n"
+BILLIARD_LINE = "[{ts}: -INFO/{logger}] {msg}\n"
+
+# the logger and the message of the patched modules, see celery_stall/modified
+MESSAGES = {
+    # Task.apply_async
+    'apply_async': ('celery.app.task', "anan: app-{pid} starts sending task:{name}"),
+    'apply_async_end': ('celery.app.task', "anan: app-{pid} ends sending task:{name} "
+                                           "with task_id:{task_id}"),
+    # Task.retry
+    'retry': ('celery.app.task', "anan: Worker-{pid} starts sending Retry task:"
+              "{{task_id:{task_id}, task_name:{name}, retries:{retries}}}"),
+    # Celery.send_task
+    'send': ('celery.app.base', "anan: app-{pid} starts sending task:"
+             "{{task_id:{task_id}, task_name:{name}}} to router:{router}"),
+    # TaskProducer.publish_task
+    'publish': ('celery.app.amqp', "anan: Consumer-{pid} starts publishing task: "
+                "{{task_id:{task_id}, task_name:{name}, retries:{retries}}}"),
+    # the default strategy
+    'received': ('celery.worker.strategy', "anan: Consumer-{pid} Received task: "
+                 "{{task_id:{task_id}, task_name:{name}, worker:None}}"),
+    # Consumer.on_task
+    'got': ('celery.worker.consumer', "anan: Consumer-{pid} got task from broker: "
+            "{{task_id:{task_id}, task_name:{name}}}"),
+    # BasePool.apply_async
+    'apply': ('celery.concurrency.base', "anan: Consumer-{pid}: Apply Task: "
+              "{{task_id:{task_id}, task_name:{name}, retries:{retries}}}"),
+    # Request.on_accepted
+    'accepted': ('celery.worker.job', "anan: Consumer-{pid} task-accepted: task: "
+                 "{{task_id:{task_id}, task_name:{name}}}"),
+    # billiard pool worker
+    'start': ('billiard.pool', "anan: Woker-{pid} starts executing task: "
+              "{{task_id:{task_id}, task_name:{name}, retries:{retries}}}"),
+    'end': ('billiard.pool', "anan: Worker-{pid} spends {value} seconds executing task: "
+            "{{task_id:{task_id}, task_name:{name}, retries:{retries}}}"),
+    'done': ('billiard.pool', "anan: Worker-{pid} notifies main process done task: "
+             "{{task_id:{task_id}, task_name:{name}, retries:{retries}}}"),
+}
+# the kind of the fixed field record of a message, see celery.utils.anan
+RECORD_KINDS = dict((k, k) for k in MESSAGES if k != 'apply_async_end')
+RECORD_KINDS['apply_async'] = 'send'
+
+# name: (random.Random method, the number of its parameters)
+DISTRIBUTIONS = {
+    'expo': (lambda r, mean: r.expovariate(1.0 / mean), 1),
+    'lognormal': (lambda r, mu, sigma: r.lognormvariate(mu, sigma), 2),
+    'uniform': (lambda r, a, b: r.uniform(a, b), 2),
+    'const': (lambda r, v: v, 1),
+    'pareto': (lambda r, scale, alpha: scale * r.paretovariate(alpha), 2),
+}
+
+
+def distribution(spec):
+    """
+    "expo:0.2" -> the function of a random.Random drawing the seconds of
+    the distribution, see DISTRIBUTIONS
+    """
+    name, _, params = spec.partition(':')
+    if name not in DISTRIBUTIONS:
+        raise ValueError("unknown distribution {}, use one of {}".format(
+            name, '|'.join(sorted(DISTRIBUTIONS))))
+    func, n = DISTRIBUTIONS[name]
+    params = [float(p) for p in params.split(',') if p]
+    if len(params) != n:
+        raise ValueError("{} needs {} parameters: {}".format(name, n, spec))
+    return lambda r: max(func(r, *params), 0.0)
+
+
+def weighted_names(spec):
+    """
+    "storage.tasks.upload:5,billing.tasks.charge:1" -> [(name, weight)],
+    the weight is 1 if it is omitted
+    """
+    names = []
+    for item in spec.split(','):
+        name, _, weight = item.partition(':')
+        names.append((name, float(weight or 1)))
+    return names
+
+
+class RotatingLog(object):
+    """
+    RotatingLog writes the lines like RotatingFileHandler, the log is
+    rolled over to log.1, log.2 ... when it exceeds max_bytes, so the
+    members are the rotation set analysis.py reads with -R.
+    @path: the log
+    @max_bytes: the max size of a member, 0 never rolls over
+    @backups: the max number of the rolled over members
+    @compress: gzip the rolled over members to log.N.gz
+    """
+    def __init__(self, path, max_bytes=0, backups=1000, compress=False):
+        super(RotatingLog, self).__init__()
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.compress = compress
+        self.lines = 0
+        self._f = open(path, 'w')
+        self._size = 0
+
+    def _member(self, i):
+        return "{}.{}{}".format(self.path, i, '.gz' if self.compress else '')
+
+    def _rollover(self):
+        self._f.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(self._member(i)):
+                os.rename(self._member(i), self._member(i + 1))
+        if self.compress:
+            with open(self.path, 'rb') as src:
+                with gzip.open(self._member(1), 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+            os.remove(self.path)
+        else:
+            os.rename(self.path, self._member(1))
+        self._f = open(self.path, 'w')
+        self._size = 0
+
+    def write(self, line):
+        if self.max_bytes and self._size + len(line) > self.max_bytes:
+            self._rollover()
+        self._f.write(line)
+        self._size += len(line)
+        self.lines += 1
+
+    def close(self):
+        self._f.close()
+
+
+class TraceLogGenerator(object):
+    """
+    TraceLogGenerator simulates the tasks sent by the apps and executed
+    by the pool processes of the celery workers, and writes the trace
+    lines in the order of their timestamps.
+    A worker applies a task to the pool process free first, the task
+    waits in the pool pipe while all the processes are busy. An attempt
+    retried sends its Retry and ends, the next attempt is published by
+    the pool process and applied after the countdown.
+    The lines are generated in one pass, only the lines of the tasks in
+    flight are kept in memory.
+    @tasks: the number of the tasks
+    @rate: the tasks sent per second
+    @names: [(task name, weight)]
+    @duration: the distribution of the seconds executing a task
+    @workers: the number of the celery workers
+    @concurrency: the number of the pool processes of every worker
+    @apps: the number of the app processes sending the tasks
+    @apply_async: the fraction of the tasks sent by Task.apply_async,
+                  the others are sent by app.send_task
+    @retry_rate: the probability an attempt is retried
+    @max_retries: the max retries of a task
+    @countdown: the seconds an attempt retried waits
+    @lost_rate: the probability a published attempt is never received
+    @jitter: the max seconds a line is written after its timestamp, the
+             lines of the processes interleave out of order, but the
+             lines of a process and the lines of a task stay in order
+    @record: write the fixed field records of ANAN_TRACE=record
+    @start: the epoch of the first task
+    @seed: the seed of the random generator
+    """
+    def __init__(self, tasks=10000, rate=50.0, names=None,
+                 duration='expo:0.2', workers=2, concurrency=8, apps=4,
+                 apply_async=0.5, retry_rate=0.05, max_retries=3,
+                 countdown=1.0, lost_rate=0.0, jitter=0.0, record=False,
+                 start=None, seed=1):
+        super(TraceLogGenerator, self).__init__()
+        self._random = random.Random(seed)
+        # the jitter has a generator of its own, the jittered log is of
+        # the same tasks as the log without jitter
+        self._jitter_random = random.Random(seed)
+        r = self._random
+        self.tasks = tasks
+        self.rate = rate
+        names = names or [('storage.tasks.upload', 5),
+                          ('storage.tasks.resize', 3),
+                          ('billing.tasks.charge', 1)]
+        self._names = [n for n, _ in names]
+        total = sum(w for _, w in names)
+        self._cum = []
+        acc = 0.0
+        for _, w in names:
+            acc += w / total
+            self._cum.append(acc)
+        self._duration = distribution(duration) \
+            if isinstance(duration, basestring) else duration
+        pids = r.sample(xrange(1000, 32768), workers * (concurrency + 1) + apps)
+        # (consumer pid, [(free at, pool pid)])
+        self._workers = []
+        for w in range(workers):
+            consumer = pids.pop()
+            pool = [(0.0, pids.pop()) for i in range(concurrency)]
+            self._workers.append((consumer, pool))
+        self._apps = [pids.pop() for _ in range(apps)]
+        self.apply_async = apply_async
+        self.retry_rate = retry_rate
+        self.max_retries = max_retries
+        self.countdown = countdown
+        self.lost_rate = lost_rate
+        self.jitter = jitter
+        self.record = record
+        self.start = start if start is not None else \
+            time.mktime((2015, 4, 14, 10, 0, 0, 0, 0, -1))
+        # (timestamp, seq, pid, task_id, line) of the lines emitted
+        self._lines = []
+        # (written at, timestamp, seq, line) of the lines to write
+        self._out = []
+        self._seq = 0
+        # pid or task_id -> when its last line is written
+        self._written = {}
+
+    def _name(self):
+        u = self._random.random()
+        for name, c in zip(self._names, self._cum):
+            if u <= c:
+                return name
+        return self._names[-1]
+
+    def _emit(self, t, kind, **kwargs):
+        s = int(t)
+        ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(s)) + \
+            ",{:03d}".format(int((t - s) * 1000))
+        logger, msg = MESSAGES[kind]
+        line = BILLIARD_LINE if logger == 'billiard.pool' else CELERY_LINE
+        if self.record and kind in RECORD_KINDS:
+            # the generated fields have nothing to escape, see billiard.anan
+            msg = "anan| {} {} {} {} {} {}".format(
+                RECORD_KINDS[kind], kwargs['pid'],
+                kwargs['task_id'] if kind != 'apply_async' else '-',
+                kwargs['name'], kwargs.get('retries', '-'),
+                kwargs.get('value', '-'))
+        else:
+            msg = msg.format(**kwargs)
+        self._seq += 1
+        heapq.heappush(self._lines, (t, self._seq, kwargs['pid'], kwargs.get('task_id'),
+                                     line.format(ts=ts, logger=logger, msg=msg)))
+
+    def _deliver(self, t, task, retries, worker, publisher):
+        """
+        Publish an attempt and deliver it to the consumer, returns when
+        it is applied to the pool or None if it is lost
+        """
+        r = self._random
+        consumer = self._workers[worker][0]
+        self._emit(t, 'publish', pid=publisher, retries=retries, **task)
+        if r.random() < self.lost_rate:
+            return None
+        t += r.expovariate(1 / 0.005)
+        self._emit(t, 'received', pid=consumer, **task)
+        t += r.expovariate(1 / 0.002)
+        self._emit(t, 'got', pid=consumer, **task)
+        if retries:
+            t += self.countdown
+        t += r.expovariate(1 / 0.001)
+        self._emit(t, 'apply', pid=consumer, retries=retries, **task)
+        return t
+
+    def _send(self, t):
+        """
+        Send a new task from an app process, returns the item of its first
+        attempt to apply
+        """
+        r = self._random
+        name = self._name()
+        task = {'task_id': str(uuid.UUID(int=r.getrandbits(128), version=4)),
+                'name': name}
+        app = r.choice(self._apps)
+        if r.random() < self.apply_async:
+            self._emit(t, 'apply_async', pid=app, name=name)
+        else:
+            self._emit(t, 'send', pid=app, router='<Router>', **task)
+        t += r.expovariate(1 / 0.0005)
+        worker = r.randrange(len(self._workers))
+        apply = self._deliver(t, task, 0, worker, app)
+        self._emit(t + 0.0005, 'apply_async_end', pid=app, **task)
+        return apply, task, 0, worker
+
+    def _execute(self, apply, task, retries, worker):
+        """
+        Execute an attempt on the pool process of the worker free first,
+        returns the item of the next attempt if it is retried
+        """
+        r = self._random
+        consumer, pool = self._workers[worker]
+        free, pid = heapq.heappop(pool)
+        t = max(apply + r.expovariate(1 / 0.0005), free)
+        self._emit(t, 'start', pid=pid, retries=retries, **task)
+        self._emit(t + r.expovariate(1 / 0.002), 'accepted', pid=consumer, **task)
+        spends = self._duration(r)
+        retry = None
+        if retries < self.max_retries and r.random() < self.retry_rate:
+            spends *= r.random()
+            rt = t + spends
+            self._emit(rt, 'retry', pid=pid, retries=retries + 1, **task)
+            self._emit(rt, 'apply_async', pid=pid, name=task['name'])
+            to = r.randrange(len(self._workers))
+            apply = self._deliver(rt + 0.0002, task, retries + 1, to, pid)
+            self._emit(rt + 0.0003, 'apply_async_end', pid=pid, **task)
+            if apply is not None:
+                retry = (apply, task, retries + 1, to)
+            spends += 0.0005
+        end = t + spends
+        self._emit(end, 'end', pid=pid, value=spends, retries=retries, **task)
+        self._emit(end + 0.001, 'done', pid=pid, retries=retries, **task)
+        heapq.heappush(pool, (end + 0.001, pid))
+        return retry
+
+    def _flush(self, out, until):
+        """
+        Write the lines written before until. No line emitted later is
+        before until, the lines before it are given when they are written
+        in the order of their timestamps: jitter seconds at most after the
+        timestamp, but not before the last line of the process or of the
+        task is written, a process writes its lines one by one and the
+        line of a task is logged after the line it follows is written.
+        """
+        lines = self._lines
+        written = self._written
+        while lines and lines[0][0] < until:
+            t, seq, pid, task_id, line = heapq.heappop(lines)
+            at = t
+            if self.jitter:
+                at = max(t + self._jitter_random.random() * self.jitter,
+                         written.get(pid, t), written.get(task_id, t))
+                written[pid] = at
+                if task_id is not None:
+                    written[task_id] = at
+            heapq.heappush(self._out, (at, t, seq, line))
+        if len(written) > 1 << 16:
+            # no line after until is bound by the lines written before it
+            self._written = dict((k, v) for k, v in written.iteritems() if v >= until)
+        lines = self._out
+        while lines and lines[0][0] < until:
+            out.write(heapq.heappop(lines)[3])
+
+    def generate(self, out):
+        """
+        Write the log lines to out, anything having a write(line)
+        """
+        r = self._random
+        applies = []
+        sent = 0
+        next_send = self.start
+        while sent < self.tasks or applies:
+            # the tasks sent before the next apply may be applied before it
+            while sent < self.tasks and (not applies or next_send <= applies[0][0]):
+                item = self._send(next_send)
+                sent += 1
+                next_send += r.expovariate(self.rate)
+                if item[0] is not None:
+                    heapq.heappush(applies, item)
+            if not applies:
+                continue
+            item = heapq.heappop(applies)
+            # no line written later is before the apply
+            self._flush(out, item[0])
+            retry = self._execute(*item)
+            if retry is not None:
+                heapq.heappush(applies, retry)
+        self._flush(out, float('inf'))
+
+
+def main():
+
+    parser = OptionParser(USAGE)
+    parser.add_option('-n', '--tasks', type='int', dest='tasks', default=10000,
+                      help='the number of the tasks')
+    parser.add_option('--rate', type='float', dest='rate', default=50.0,
+                      help='the tasks sent per second')
+    parser.add_option('-t', '--task-names', type='string', dest='names',
+                      default='storage.tasks.upload:5,storage.tasks.resize:3,'
+                              'billing.tasks.charge:1',
+                      help='the task names and their weights, name:weight,...')
+    parser.add_option('-d', '--duration', type='string', dest='duration',
+                      default='expo:0.2',
+                      help='the seconds executing a task[{}], e.g. lognormal:-2,1'
+                           .format('|'.join(sorted(DISTRIBUTIONS))))
+    parser.add_option('-w', '--workers', type='int', dest='workers', default=2,
+                      help='the number of the celery workers')
+    parser.add_option('-c', '--concurrency', type='int', dest='concurrency', default=8,
+                      help='the number of the pool processes of every worker')
+    parser.add_option('-a', '--apps', type='int', dest='apps', default=4,
+                      help='the number of the app processes sending the tasks')
+    parser.add_option('--apply-async', type='float', dest='apply_async', default=0.5,
+                      help='the fraction of the tasks sent by Task.apply_async')
+    parser.add_option('-r', '--retry-rate', type='float', dest='retry_rate', default=0.05,
+                      help='the probability an attempt is retried')
+    parser.add_option('--max-retries', type='int', dest='max_retries', default=3,
+                      help='the max retries of a task')
+    parser.add_option('--countdown', type='float', dest='countdown', default=1.0,
+                      help='the seconds an attempt retried waits')
+    parser.add_option('--lost-rate', type='float', dest='lost_rate', default=0.0,
+                      help='the probability a published attempt is never received')
+    parser.add_option('-j', '--jitter', type='float', dest='jitter', default=0.0,
+                      help='the max seconds a line is written after its timestamp')
+    parser.add_option('--record', action='store_true', dest='record', default=False,
+                      help='write the fixed field records of ANAN_TRACE=record')
+    parser.add_option('-o', '--out', type='string', dest='out', default='task.log',
+                      help='the log to write')
+    parser.add_option('--max-mb', type='float', dest='max_mb', default=0,
+                      help='roll the log over to log.1, log.2 ... every MB')
+    parser.add_option('--gzip', action='store_true', dest='gzip', default=False,
+                      help='gzip the rolled over members to log.N.gz')
+    parser.add_option('-s', '--seed', type='int', dest='seed', default=1,
+                      help='the seed of the random generator')
+
+    options, args = parser.parse_args()
+    if args:
+        parser.print_help()
+        print "Error: no command is needed"
+        return 1
+
+    generator = TraceLogGenerator(
+        options.tasks, options.rate, weighted_names(options.names),
+        options.duration, options.workers, options.concurrency, options.apps,
+        options.apply_async, options.retry_rate, options.max_retries,
+        options.countdown, options.lost_rate, options.jitter,
+        options.record, seed=options.seed)
+    out = RotatingLog(options.out, int(options.max_mb * (1 << 20)),
+                      compress=options.gzip)
+    b = time.time()
+    try:
+        generator.generate(out)
+    finally:
+        out.close()
+    print("{} lines of {} tasks written to {} in {:.3f} seconds".format(
+        out.lines, options.tasks, options.out, time.time() - b))
+
+if __name__ == '__main__':
+    sys.exit(main())
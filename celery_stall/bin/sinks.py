@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import csv
+import sys
+import struct
+import numpy as np
+import pandas as pd
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+
+
+def report_type(type):
+    """
+    The report type to write, npy instead of parquet and feather if
+    pyarrow is not installed
+    """
+    type = type or 'csv'
+    if type in ('parquet', 'feather') and pa is None:
+        sys.stderr.write("pyarrow is not installed, build the npy report instead\n")
+        return 'npy'
+    return type
+
+
+class CsvSink(object):
+    """
+    CsvSink writes the rows of a report with csv.DictWriter
+    @path: the csv file
+    @header: the csv header
+    @types: not used, the csv is not typed
+    @append: append to the existing file instead of creating it
+    """
+    # the rows of the parallel build are formatted as csv lines
+    csv_rows = True
+
+    def __init__(self, path, header, types=None, append=False):
+        super(CsvSink, self).__init__()
+        if not (append and os.path.exists(path)):
+            with open(path, 'wb') as f:
+                w = csv.DictWriter(f, header)
+                w.writeheader()
+        self._fd = open(path, 'a')
+        self._writer = csv.DictWriter(self._fd, header)
+
+    def write(self, data):
+        self._writer.writerow(data)
+
+    def write_rows(self, rows):
+        """
+        Write the rows already formatted as csv lines
+        """
+        self._fd.writelines(rows)
+
+    def sync(self):
+        """
+        Flush the written rows to disk, returns the size of the file
+        """
+        self._fd.flush()
+        os.fsync(self._fd.fileno())
+        return os.fstat(self._fd.fileno()).st_size
+
+    def truncate(self, size):
+        """
+        Drop the rows written after size, the next row is appended
+        """
+        self._fd.truncate(size)
+
+    def close(self):
+        self._fd.close()
+
+
+def _typed(values, t):
+    """
+    Convert a column to the python values of the type, None for the
+    missing or malformed values
+    """
+    conv = float if t == 'f8' else int if t == 'i8' else None
+    if conv is None:
+        return [v if v is None else str(v) for v in values]
+    out = []
+    for v in values:
+        try:
+            out.append(conv(v))
+        except (TypeError, ValueError):
+            out.append(None)
+    return out
+
+
+class ColumnarSink(object):
+    """
+    ColumnarSink buffers the rows of a report into columns and writes
+    them to a typed columnar file a batch at a time.
+    @path: the report file
+    @header: the columns
+    @types: column -> 'f8', 'i8' or 'S<width>', default 'S128'
+    @append: a columnar report can not be appended
+    @batch_size: the rows of a batch
+    """
+    csv_rows = False
+
+    def __init__(self, path, header, types=None, append=False,
+                 batch_size=65536):
+        super(ColumnarSink, self).__init__()
+        if append:
+            raise ValueError("{} can not be appended".format(path))
+        self.path = path
+        self.header = header
+        self.types = [(types or {}).get(f, 'S128') for f in header]
+        self.count = 0
+        self._batch_size = batch_size
+        self._columns = [[] for _ in header]
+        self._open()
+
+    def write(self, data):
+        for c, f in zip(self._columns, self.header):
+            c.append(data.get(f))
+        if len(self._columns[0]) >= self._batch_size:
+            self.flush()
+
+    def write_rows(self, rows):
+        """
+        Write the rows of values in the order of the header
+        """
+        columns = self._columns
+        for row in rows:
+            for c, v in zip(columns, row):
+                c.append(v)
+            if len(columns[0]) >= self._batch_size:
+                self.flush()
+                columns = self._columns
+
+    def flush(self):
+        n = len(self._columns[0])
+        if n:
+            self._write_batch([_typed(c, t) for c, t
+                               in zip(self._columns, self.types)])
+            self.count += n
+            self._columns = [[] for _ in self.header]
+
+    def sync(self):
+        self.flush()
+        return self.count
+
+    def truncate(self, size):
+        raise ValueError("{} can not be truncated".format(self.path))
+
+    def close(self):
+        self.flush()
+        self._close()
+
+
+class ParquetSink(ColumnarSink):
+    """
+    ParquetSink writes every batch as a row group of a parquet file
+    """
+    def _open(self):
+        self._schema = pa.schema([pa.field(f, _arrow_type(t)) for f, t
+                                  in zip(self.header, self.types)])
+        self._writer = pq.ParquetWriter(self.path, self._schema)
+
+    def _write_batch(self, columns):
+        arrays = [pa.array(c, type=f.type) for c, f in zip(columns, self._schema)]
+        self._writer.write_table(pa.Table.from_arrays(arrays, names=self.header))
+
+    def _close(self):
+        self._writer.close()
+
+
+class FeatherSink(ParquetSink):
+    """
+    FeatherSink keeps the batches as arrow record batches, the feather
+    file is written when the report is closed.
+    """
+    def _open(self):
+        self._schema = pa.schema([pa.field(f, _arrow_type(t)) for f, t
+                                  in zip(self.header, self.types)])
+        self._batches = []
+
+    def _write_batch(self, columns):
+        arrays = [pa.array(c, type=f.type) for c, f in zip(columns, self._schema)]
+        self._batches.append(pa.RecordBatch.from_arrays(arrays, self.header))
+
+    def _close(self):
+        table = pa.Table.from_batches(self._batches, schema=self._schema)
+        feather.write_feather(table.to_pandas(), self.path)
+
+
+class NpySink(ColumnarSink):
+    """
+    NpySink writes a structured .npy file which np.load can memory map,
+    the batches are appended as raw records and the shape in the npy
+    header is set when the report is closed.
+    The missing values are '' of the strings, NaN of the floats and -1
+    of the integers.
+    """
+    _missing = {'f': float('nan'), 'i': -1, 'S': ''}
+
+    def _open(self):
+        self._dtype = np.dtype([(f, t) for f, t in zip(self.header, self.types)])
+        self._fd = open(self.path, 'wb')
+        self._header_len = len(self._npy_header(0))
+        self._fd.write(self._npy_header(0))
+
+    def _npy_header(self, count):
+        header = "{{'descr': {!r}, 'fortran_order': False, 'shape': ({:>20},), }}"\
+            .format(np.lib.format.dtype_to_descr(self._dtype), "%d" % count)
+        # magic, version 1.0, the header length, aligned to 64 bytes
+        pad = 64 - (10 + len(header) + 1) % 64
+        header = header + ' ' * pad + '\n'
+        return '\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header
+
+    def _write_batch(self, columns):
+        batch = np.empty(len(columns[0]), dtype=self._dtype)
+        for f, t, c in zip(self.header, self.types, columns):
+            missing = self._missing[t[0]]
+            batch[f] = [missing if v is None else v for v in c]
+        batch.tofile(self._fd)
+
+    def _close(self):
+        self._fd.seek(0)
+        header = self._npy_header(self.count)
+        assert len(header) == self._header_len
+        self._fd.write(header)
+        self._fd.close()
+
+
+def _arrow_type(t):
+    return pa.float64() if t == 'f8' else pa.int64() if t == 'i8' \
+        else pa.string()
+
+
+# report type -> the sink writes the report
+SINKS = {'csv': CsvSink, 'parquet': ParquetSink, 'feather': FeatherSink,
+         'npy': NpySink}
+
+
+def _npy_frame(records):
+    """
+    The DataFrame of the npy records, the missing strings are NaN as
+    they are read from the csv report
+    """
+    df = pd.DataFrame(records)
+    for c in df.columns:
+        if df[c].dtype.kind == 'O':
+            df[c] = df[c].replace('', np.nan)
+    return df
+
+
+def load_report(path):
+    """
+    Load a report of any type into a DataFrame by its suffix, the npy
+    report is memory mapped.
+    """
+    suffix = os.path.splitext(path)[1]
+    if suffix == '.parquet':
+        return pd.read_parquet(path)
+    elif suffix == '.feather':
+        return pd.read_feather(path)
+    elif suffix == '.npy':
+        return _npy_frame(np.load(path, mmap_mode='r'))
+    return pd.read_csv(path)
+
+
+def iter_report(path, rows=1 << 20):
+    """
+    Iterate over a report of any type as DataFrames of about rows rows,
+    a parquet report is read a row group at a time, a feather report
+    can only be read at a time.
+    """
+    suffix = os.path.splitext(path)[1]
+    if suffix == '.parquet':
+        f = pq.ParquetFile(path)
+        for i in xrange(f.num_row_groups):
+            yield f.read_row_group(i).to_pandas()
+    elif suffix == '.feather':
+        yield pd.read_feather(path)
+    elif suffix == '.npy':
+        records = np.load(path, mmap_mode='r')
+        for i in xrange(0, len(records), rows):
+            yield _npy_frame(records[i:i + rows])
+    else:
+        for df in pd.read_csv(path, chunksize=rows):
+            yield df
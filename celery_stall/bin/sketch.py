@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import math
+import numpy as np
+
+from collections import Counter
+
+
+class QuantileSketch(object):
+    """
+    QuantileSketch
+    A mergeable quantile sketch of the log bucketed histogram, every
+    value v is counted in the bucket ceil(log(|v|)/log(gamma)), so any
+    quantile is within the relative accuracy of the exact one and the
+    memory is bounded by the range of the values instead of the count.
+    The sketches of the chunks of a report, or of the processes, are
+    merged into the sketch of all the values.
+    @accuracy: the relative accuracy of the quantiles
+    """
+    # the values closer to 0 are counted as 0
+    min_value = 1e-9
+
+    def __init__(self, accuracy=0.01):
+        super(QuantileSketch, self).__init__()
+        self.accuracy = accuracy
+        self._gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.positive = Counter()
+        self.negative = Counter()
+        self.zero = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def _key(self, v):
+        return int(math.ceil(math.log(v) / self._log_gamma))
+
+    def _value(self, key):
+        return 2 * self._gamma ** key / (self._gamma + 1)
+
+    def add(self, v):
+        """
+        Count a value, the NaN is ignored
+        """
+        if v != v:
+            return
+        if v > self.min_value:
+            self.positive[self._key(v)] += 1
+        elif v < -self.min_value:
+            self.negative[self._key(-v)] += 1
+        else:
+            self.zero += 1
+        self.count += 1
+        self.sum += v
+        self.min = min(self.min, v)
+        self.max = max(self.max, v)
+
+    def add_many(self, values):
+        """
+        Count an array of values at a time, the NaNs are ignored
+        """
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        for counter, vs in ((self.positive, values[values > self.min_value]),
+                            (self.negative, -values[values < -self.min_value])):
+            if len(vs):
+                keys, counts = np.unique(
+                    np.ceil(np.log(vs) / self._log_gamma).astype(int),
+                    return_counts=True)
+                counter.update(dict(zip(keys.tolist(), counts.tolist())))
+        self.zero += int((np.abs(values) <= self.min_value).sum())
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def merge(self, other):
+        """
+        Merge the sketch of the same accuracy into this one
+        """
+        if other.accuracy != self.accuracy:
+            raise ValueError("can not merge the sketch of accuracy {} into {}"
+                             .format(other.accuracy, self.accuracy))
+        self.positive.update(other.positive)
+        self.negative.update(other.negative)
+        self.zero += other.zero
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        """
+        The value of the quantile q in [0, 1], NaN if no value is counted
+        """
+        if not self.count:
+            return float('nan')
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        rank = q * (self.count - 1)
+        seen = 0
+        buckets = [(-self._value(k), self.negative[k])
+                   for k in sorted(self.negative, reverse=True)]
+        buckets.append((0.0, self.zero))
+        buckets.extend((self._value(k), self.positive[k])
+                       for k in sorted(self.positive))
+        for value, n in buckets:
+            seen += n
+            if seen > rank:
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else float('nan')
+
+    def __len__(self):
+        return len(self.positive) + len(self.negative)
@@ -9,6 +9,7 @@ app="celery/app"
 concurrency="celery/concurrency"
 processes="celery/concurrency/processes"
 worker="celery/worker"
+utils="celery/utils"
 
 logged_c="celery"
 logged_b="billiard"
@@ -45,6 +46,7 @@ upload()
     set -x o
     echo "upload logged source files"
     scp $logged_b"/pool.py" $unstable_stack":"$lib_path"/"$billiard
+    scp $logged_b"/anan.py" $unstable_stack":"$lib_path"/"$billiard
     scp $logged_c"/app/amqp.py" $unstable_stack":"$lib_path"/"$app"/"
     scp $logged_c"/app/base.py" $unstable_stack":"$lib_path"/"$app"/"
     scp $logged_c"/app/task.py" $unstable_stack":"$lib_path"/"$app"/"
@@ -53,6 +55,7 @@ upload()
     scp $logged_c"/worker/job.py" $unstable_stack":"$lib_path"/"$worker"/"
     scp $logged_c"/concurrency/base.py" $unstable_stack":"$lib_path"/"$concurrency"/"
     scp $logged_c"/concurrency/processes/__init__.py" $unstable_stack":"$lib_path"/"$processes"/"
+    scp $logged_c"/utils/anan.py" $unstable_stack":"$lib_path"/"$utils"/"
     echo "Done!"
 }
 
@@ -67,6 +70,9 @@ restore()
     scp $backup"/worker/strategy.py" $unstable_stack":"$lib_path"/"$worker"/"
     scp $backup"/concurrency/base.py" $unstable_stack":"$lib_path"/"$concurrency"/"
     scp $backup"/concurrency/processes/__init__.py" $unstable_stack":"$lib_path"/"$processes"/"
+    # celery.utils.anan and billiard.anan are not celery and billiard modules
+    ssh $unstable_stack "rm -f $lib_path/$utils/anan.py $lib_path/$utils/anan.pyc"
+    ssh $unstable_stack "rm -f $lib_path/$billiard/anan.py $lib_path/$billiard/anan.pyc"
     echo "Done!"
 }
 
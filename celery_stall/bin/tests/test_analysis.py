@@ -0,0 +1,297 @@
+# coding=utf-8
+"""
+The tests of analysis.py, run in celery_stall/bin:
+    python -m unittest discover -s tests -t .
+"""
+
+import os
+import imp
+import csv
+import time
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import analysis
+from analysis import (Analyzer, PendingTable, lttb, minmax_downsample,
+                      merge_events, pool_timeline, stall_windows, decoder,
+                      classifier, _line_task_id)
+from loggen import TraceLogGenerator, RotatingLog
+
+
+def generate_log(path, tasks, **kwargs):
+    out = RotatingLog(path)
+    try:
+        TraceLogGenerator(tasks, **kwargs).generate(out)
+    finally:
+        out.close()
+    return path
+
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class AnalyzerTestCase(unittest.TestCase):
+    """
+    Run every test in a scratch directory, the reports are written to
+    its reports directory
+    """
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp(prefix='analysis-test-')
+        os.chdir(self.dir)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        shutil.rmtree(self.dir)
+
+    def build(self, out, log, data='all', **kwargs):
+        """
+        Build the reports of the log in the directory out, returns
+        {report file: its content}
+        """
+        os.mkdir(out)
+        os.chdir(out)
+        try:
+            analyzer = Analyzer(data, log, **kwargs)
+            analyzer.run()
+            return dict((f, read_file(os.path.join('reports', f)))
+                        for f in os.listdir('reports')), analyzer
+        finally:
+            os.chdir(self.dir)
+
+
+class RecordTest(unittest.TestCase):
+
+    def setUp(self):
+        # billiard.anan formats the records of the patched modules
+        self.anan = imp.load_source('billiard_anan', os.path.join(
+            os.path.dirname(os.path.abspath(analysis.__file__)),
+            os.pardir, 'modified', 'billiard', 'anan.py'))
+
+    def classify(self, *args):
+        line = '[2015-04-14 10:00:00,000: INFO/MainProcess] {}\n'.format(
+            self.anan.record(*args))
+        return classifier.classify(line), _line_task_id(line)
+
+    def test_fields_with_spaces(self):
+        ev, task_id = self.classify('start', 12, 'id 1', u'proj.tasks.add me', 2, None)
+        self.assertEqual((ev.kind, ev.pid, ev.task_id, ev.queue, ev.task_name,
+                          ev.retries, ev.value),
+                         ('start', '12', 'id 1', 'proj', 'add me', '2', None))
+        self.assertEqual(task_id, 'id 1')
+
+    def test_missing_and_escaped_fields(self):
+        ev, task_id = self.classify('send', 3, None, 'proj.add', None, None)
+        self.assertEqual((ev.task_id, ev.retries, ev.value), (None, 0, None))
+        self.assertEqual(task_id, None)
+        ev, task_id = self.classify('end', 3, '-', 'proj.add', 0, '50% -\n1')
+        self.assertEqual((ev.task_id, ev.retries, ev.value), ('-', '0', '50% -\n1'))
+        self.assertEqual(task_id, '-')
+
+
+class PendingTableTest(AnalyzerTestCase):
+
+    def test_max_size_evicts_the_first(self):
+        spilled = []
+        table = PendingTable(max_size=2, spill=lambda r, rec: spilled.append((r, rec)))
+        for i in range(4):
+            table[str(i)] = {'task_id': str(i)}
+        self.assertEqual(list(table), ['2', '3'])
+        self.assertEqual(spilled, [('evicted', {'task_id': '0'}),
+                                   ('evicted', {'task_id': '1'})])
+
+    def test_ttl_expires_by_the_log_time(self):
+        spilled = []
+        table = PendingTable(ttl=10, ts_fields=('start', 'end'),
+                             spill=lambda r, rec: spilled.append((r, rec['task_id'])))
+        table['a'] = {'task_id': 'a', 'start': '2015-04-14 10:00:00,000'}
+        table['b'] = {'task_id': 'b', 'end': '2015-04-14 10:00:05,000'}
+        table['c'] = {'task_id': 'c'}
+        table.expire(decoder.decode('2015-04-14 10:00:12,000'))
+        self.assertEqual(spilled, [('expired', 'a')])
+        self.assertEqual(list(table), ['b', 'c'])
+
+    def test_spill_to_the_orphans_csv(self):
+        log = generate_log(os.path.join(self.dir, 'task.log'), 300, seed=3)
+        reports, analyzer = self.build('evicted', log, 'lifecycle', max_pending=5,
+                                       orphans=True)
+        report = analyzer.reports[0]
+        self.assertTrue(report.spilled['evicted'])
+        with open(os.path.join('evicted', report.orphans)) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), sum(report.spilled.values()))
+        self.assertEqual(sum(1 for r in rows if r['reason'] == 'evicted'),
+                         report.spilled['evicted'])
+
+        reports, analyzer = self.build('expired', log, 'lifecycle', pending_ttl=0.001,
+                                       orphans=True)
+        report = analyzer.reports[0]
+        self.assertTrue(report.spilled['expired'])
+        with open(os.path.join('expired', report.orphans)) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(sum(1 for r in rows if r['reason'] == 'expired'),
+                         report.spilled['expired'])
+
+
+class BuildTest(AnalyzerTestCase):
+
+    def test_parallel_build_is_the_serial_build(self):
+        log = generate_log(os.path.join(self.dir, 'task.log'), 2000, retry_rate=0.2,
+                           apply_async=0.5, seed=5)
+        serial, _ = self.build('serial', log, orphans=True)
+        parallel, _ = self.build('parallel', log, jobs=3, orphans=True)
+        self.assertEqual(sorted(serial), sorted(parallel))
+        for name in serial:
+            self.assertEqual(serial[name], parallel[name], name)
+
+    def test_follow_restart_is_the_full_build(self):
+        log = generate_log(os.path.join(self.dir, 'task.log'), 1000, retry_rate=0.2,
+                           seed=7)
+        full, _ = self.build('full', log)
+
+        content = read_file(log)
+        half = content.index('\n', len(content) // 2) + 1
+        os.mkdir('follow')
+        os.chdir('follow')
+        followed = os.path.join(self.dir, 'follow', 'task.log')
+        sleep = time.sleep
+
+        def _stop(seconds):
+            raise KeyboardInterrupt()
+        analysis.time.sleep = _stop
+        try:
+            with open(followed, 'wb') as f:
+                f.write(content[:half])
+            Analyzer('all', followed, follow=True).follow(interval=0)
+            with open(followed, 'ab') as f:
+                f.write(content[half:])
+            Analyzer('all', followed, follow=True).follow(interval=0)
+        finally:
+            analysis.time.sleep = sleep
+            os.chdir(self.dir)
+        for name in full:
+            self.assertEqual(full[name], read_file(os.path.join('follow', 'reports', name)),
+                             name)
+
+
+class DownsampleTest(unittest.TestCase):
+
+    def setUp(self):
+        rnd = np.random.RandomState(1)
+        self.x = np.arange(10000, dtype=float)
+        self.y = rnd.normal(size=len(self.x)).cumsum()
+
+    def test_lttb_keeps_the_endpoints(self):
+        x, y = lttb(self.x, self.y, 100)
+        self.assertEqual(len(x), 100)
+        self.assertEqual((x[0], y[0]), (self.x[0], self.y[0]))
+        self.assertEqual((x[-1], y[-1]), (self.x[-1], self.y[-1]))
+        self.assertTrue((np.diff(x) > 0).all())
+
+    def test_minmax_keeps_the_endpoints_and_the_peaks(self):
+        x, y = minmax_downsample(self.x, self.y, 50)
+        self.assertLessEqual(len(x), 102)
+        self.assertTrue((np.diff(x) > 0).all())
+        self.assertEqual(x[0], self.x[0])
+        self.assertEqual(x[-1], self.x[-1])
+        self.assertEqual(y.max(), self.y.max())
+        self.assertEqual(y.min(), self.y.min())
+
+    def test_short_series_are_kept(self):
+        for func, n in ((lttb, 100), (minmax_downsample, 50)):
+            x, y = func(self.x[:20], self.y[:20], n)
+            self.assertTrue((x == self.x[:20]).all())
+
+
+def record_line(t, kind, pid, task_id, name='proj.tasks.add', retries=0):
+    s = int(t)
+    ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(s)) + \
+        ",{:03d}".format(int(round((t - s) * 1000)))
+    return "[{}: INFO/MainProcess] anan| {} {} {} {} {} -\n".format(
+        ts, kind, pid, task_id, name, retries)
+
+
+class MergeTest(AnalyzerTestCase):
+
+    def test_merge_in_the_corrected_time(self):
+        t = time.mktime((2015, 4, 14, 10, 0, 0, 0, 0, -1))
+        # node2 is 5 seconds ahead, its tasks are received 0.1 second
+        # after they are published on node1
+        with open('node1.log', 'w') as f:
+            f.writelines(record_line(t + i, 'publish', 100, 'task%d' % i)
+                         for i in range(10))
+        with open('node2.log', 'w') as f:
+            f.writelines(record_line(t + i + 5.1, 'received', 200, 'task%d' % i)
+                         for i in range(10))
+        nodes = [('node1', ['node1.log']), ('node2', ['node2.log'])]
+
+        events = list(merge_events(nodes, offsets={'node2': 5.0}))
+        self.assertEqual(len(events), 20)
+        epochs = [ev.epoch for ev in events]
+        self.assertEqual(epochs, sorted(epochs))
+        self.assertEqual([ev.kind for ev in events], ['publish', 'received'] * 10)
+        self.assertEqual(set(ev.pid for ev in events), set(['node1/100', 'node2/200']))
+        for publish, received in zip(events[::2], events[1::2]):
+            self.assertEqual(publish.task_id, received.task_id)
+            self.assertAlmostEqual(received.epoch - publish.epoch, 0.1, places=3)
+
+        # without the offset node2 comes after all of node1
+        events = list(merge_events(nodes))
+        self.assertEqual([ev.kind for ev in events][:11], ['publish'] * 5 +
+                         ['publish', 'received'] * 3)
+
+
+def pool_report(rows):
+    """
+    The pool report of the (pid, received, apply, start, end) seconds
+    """
+    t = time.mktime((2015, 4, 14, 10, 0, 0, 0, 0, -1))
+    columns = dict((c, []) for c in Analyzer._csv_pool_fields)
+    for i, (pid, received, apply, start, end) in enumerate(rows):
+        for c, v in (('received', received), ('apply', apply), ('start', start),
+                     ('end', end)):
+            columns[c].append(decoder.encode(t + v))
+        columns['pid'].append(pid)
+        columns['consumer'].append(10)
+        columns['task_id'].append('task%d' % i)
+        columns['task_name'].append('add')
+        columns['queue'].append('proj')
+        columns['retries'].append(0)
+        columns['reserved'].append(apply - received)
+        columns['queued'].append(start - apply)
+        columns['busy'].append(end - start)
+    return pd.DataFrame(columns, columns=Analyzer._csv_pool_fields)
+
+
+class StallTest(unittest.TestCase):
+
+    def test_no_stall_when_the_tasks_wait_for_busy_processes(self):
+        # two processes busy back to back, a task only waits while both
+        # of them are busy
+        rows = []
+        for i in range(10):
+            rows.append((1, i, i, i, i + 1) if i != 5 else (1, 3.5, 3.5, 5, 6))
+            rows.append((2, i, i, i + 0.001, i + 1))
+        timeline, procs = pool_timeline(pool_report(sorted(rows, key=lambda r: r[3])))
+        self.assertFalse(timeline.stall.any())
+        self.assertEqual(len(stall_windows(timeline)), 0)
+        self.assertEqual(set(timeline.worker), set(['10']))
+
+    def test_stall_when_a_task_waits_for_an_idle_process(self):
+        rows = [(1, i, i, i, i + 1) for i in range(10)]
+        # applied at 2 but started at 6 while process 2 is idle
+        rows += [(2, 0, 0, 0, 1), (2, 2, 2, 6, 7), (2, 9, 9, 9, 10)]
+        timeline, procs = pool_timeline(pool_report(sorted(rows, key=lambda r: r[3])))
+        windows = stall_windows(timeline)
+        self.assertEqual(len(windows), 1)
+        self.assertEqual(windows.seconds.iloc[0], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+# coding=utf-8
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from capture import CaptureWriter, CaptureReader, SYNC, BLOCK_HEADER, MAGIC
+
+
+def task_events(n):
+    for i in range(n):
+        uuid = 'task%d' % i
+        yield {'type': 'task-sent', 'uuid': uuid, 'name': 'proj.add', 'timestamp': i}
+        yield {'type': 'task-succeeded', 'uuid': uuid, 'timestamp': i + 0.5}
+
+
+class CaptureTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='capture-test-')
+        self.path = os.path.join(self.dir, 'events.cap')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def capture(self, events, block_size=1024):
+        writer = CaptureWriter(self.path, block_size=block_size, sync_interval=3600.0)
+        for i, event in enumerate(events):
+            writer.write(event, 1000.0 + i)
+        writer.close()
+        return writer
+
+    def block_offsets(self):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        offsets = []
+        i = data.find(SYNC, len(MAGIC))
+        while i >= 0:
+            offsets.append(i)
+            i = data.find(SYNC, i + 1)
+        return data, offsets
+
+    def test_round_trip(self):
+        writer = self.capture(task_events(100))
+        reader = CaptureReader(self.path)
+        events = list(reader.events())
+        self.assertEqual(len(events), 200)
+        self.assertGreater(writer.blocks, 1)
+        self.assertEqual(events[0], (1000.0, 'proj.add', dict(
+            type='task-sent', uuid='task0', name='proj.add', timestamp=0)))
+        # the succeeded events are named by their sent events
+        self.assertEqual(events[1][1], 'proj.add')
+        self.assertEqual(reader.skipped, 0)
+
+    def test_crc_mismatch_skips_the_block(self):
+        self.capture(task_events(100))
+        data, offsets = self.block_offsets()
+        # flip a byte of the stored records of the second block
+        i = offsets[1] + len(SYNC) + BLOCK_HEADER.size + 10
+        with open(self.path, 'wb') as f:
+            f.write(data[:i] + chr(ord(data[i]) ^ 0xff) + data[i + 1:])
+        n = BLOCK_HEADER.unpack_from(data, offsets[1] + len(SYNC))[0]
+        reader = CaptureReader(self.path)
+        self.assertEqual(len(list(reader.events())), 200 - n)
+        self.assertEqual(reader.skipped, 1)
+
+    def test_resync_after_a_torn_block(self):
+        self.capture(task_events(100))
+        data, offsets = self.block_offsets()
+        # the second block is cut short, the reader resyncs to the third
+        torn = data[:offsets[1] + len(SYNC) + BLOCK_HEADER.size + 5] + data[offsets[2]:]
+        with open(self.path, 'wb') as f:
+            f.write(torn)
+        n = BLOCK_HEADER.unpack_from(data, offsets[1] + len(SYNC))[0]
+        reader = CaptureReader(self.path)
+        events = list(reader.events())
+        self.assertEqual(len(events), 200 - n)
+        self.assertEqual(reader.skipped, 1)
+        self.assertEqual(events[-1][2]['uuid'], 'task99')
+
+    def test_torn_tail(self):
+        self.capture(task_events(100))
+        data, offsets = self.block_offsets()
+        with open(self.path, 'wb') as f:
+            f.write(data[:-3])
+        n = BLOCK_HEADER.unpack_from(data, offsets[-1] + len(SYNC))[0]
+        reader = CaptureReader(self.path)
+        self.assertEqual(len(list(reader.events())), 200 - n)
+        self.assertEqual(reader.skipped, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# coding=utf-8
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from sinks import SINKS, load_report, iter_report, report_type, pa
+
+HEADER = ('task_id', 'start', 'duration', 'retries')
+TYPES = {'task_id': 'S36', 'start': 'S23', 'duration': 'f8', 'retries': 'i8'}
+ROWS = [{'task_id': 'task%d' % i, 'start': '2015-04-14 10:00:%02d,000' % i,
+         'duration': i * 0.25, 'retries': i % 3} for i in range(50)]
+# a row with the missing values
+ROWS.append({'task_id': 'task50', 'start': None, 'duration': None, 'retries': None})
+
+
+class SinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='sinks-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def round_trip(self, type):
+        path = os.path.join(self.dir, 'report.{}'.format(type))
+        sink = SINKS[type](path, HEADER, TYPES)
+        for row in ROWS:
+            sink.write(row)
+        sink.close()
+        df = load_report(path)
+        self.assertEqual(list(df.columns), list(HEADER))
+        self.assertEqual(len(df), len(ROWS))
+        self.assertEqual([str(v) for v in df.task_id], [r['task_id'] for r in ROWS])
+        self.assertEqual(list(df.start[:-1]), [r['start'] for r in ROWS[:-1]])
+        np.testing.assert_array_equal(df.duration.values[:-1],
+                                      [r['duration'] for r in ROWS[:-1]])
+        self.assertEqual(list(df.retries[:-1]), [r['retries'] for r in ROWS[:-1]])
+        self.assertTrue(np.isnan(df.duration.values[-1]))
+        # the missing strings are read as NaN from every type
+        self.assertTrue(pd.isnull(df.start.values[-1]))
+        chunks = list(iter_report(path, rows=16))
+        self.assertEqual(sum(len(c) for c in chunks), len(ROWS))
+        return df
+
+    def test_csv(self):
+        self.round_trip('csv')
+
+    def test_npy(self):
+        df = self.round_trip('npy')
+        # the missing integer of the npy report
+        self.assertEqual(df.retries.values[-1], -1)
+
+    @unittest.skipIf(pa is None, 'pyarrow is not installed')
+    def test_parquet(self):
+        self.round_trip('parquet')
+
+    @unittest.skipIf(pa is None, 'pyarrow is not installed')
+    def test_feather(self):
+        self.round_trip('feather')
+
+    def test_report_type(self):
+        self.assertEqual(report_type(None), 'csv')
+        self.assertEqual(report_type('parquet'), 'parquet' if pa is not None else 'npy')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+# coding=utf-8
+
+import unittest
+
+import numpy as np
+
+from sketch import QuantileSketch
+
+
+class QuantileSketchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.values = np.random.RandomState(1).lognormal(0, 2, 20000)
+
+    def assertRelativeError(self, sketch, values, accuracy):
+        values = np.sort(values)
+        for q in (0.01, 0.1, 0.5, 0.9, 0.99, 0.999):
+            exact = values[int(q * (len(values) - 1))]
+            self.assertLessEqual(abs(sketch.quantile(q) - exact), accuracy * exact,
+                                 'p{:g}'.format(q * 100))
+
+    def test_relative_error_bound(self):
+        for accuracy in (0.01, 0.05):
+            sketch = QuantileSketch(accuracy)
+            for v in self.values:
+                sketch.add(v)
+            self.assertRelativeError(sketch, self.values, accuracy)
+            self.assertEqual(sketch.count, len(self.values))
+            self.assertEqual(sketch.quantile(0), self.values.min())
+            self.assertEqual(sketch.quantile(1), self.values.max())
+
+    def test_add_many_is_add(self):
+        one, many = QuantileSketch(), QuantileSketch()
+        for v in self.values:
+            one.add(v)
+        many.add_many(list(self.values) + [float('nan')])
+        self.assertEqual(one.positive, many.positive)
+        self.assertEqual(one.count, many.count)
+        self.assertAlmostEqual(one.sum, many.sum)
+
+    def test_merge(self):
+        values = np.concatenate([self.values, -self.values[:100], [0.0] * 10])
+        parts = [QuantileSketch() for _ in range(4)]
+        for i, part in enumerate(parts):
+            part.add_many(values[i::4])
+        merged = parts[0]
+        for part in parts[1:]:
+            merged.merge(part)
+        whole = QuantileSketch()
+        whole.add_many(values)
+        self.assertEqual(merged.positive, whole.positive)
+        self.assertEqual(merged.negative, whole.negative)
+        self.assertEqual(merged.zero, whole.zero)
+        self.assertEqual((merged.count, merged.min, merged.max),
+                         (whole.count, whole.min, whole.max))
+        for q in (0.1, 0.5, 0.99):
+            self.assertEqual(merged.quantile(q), whole.quantile(q))
+
+    def test_merge_of_another_accuracy(self):
+        self.assertRaises(ValueError, QuantileSketch(0.01).merge, QuantileSketch(0.02))
+
+    def test_empty(self):
+        self.assertTrue(np.isnan(QuantileSketch().quantile(0.5)))
+
+
+if __name__ == '__main__':
+    unittest.main()
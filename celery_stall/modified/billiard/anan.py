@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+    billiard.anan
+    ~~~~~~~~~~~~~
+
+    The fixed field trace records of the patched modules, they are
+    logged instead of the "anan:" messages if the environment variable
+    ANAN_TRACE=record, and split by analysis.py without any parsing.
+
+    The records are formatted here for billiard.pool and for
+    celery.utils.anan, billiard does not import celery but celery
+    imports billiard.
+
+"""
+from __future__ import absolute_import
+
+import os
+
+#: log the fixed field records instead of the messages
+RECORD = os.environ.get('ANAN_TRACE') == 'record'
+
+#: the characters escaped in a field, % first
+ESCAPES = (('%', '%25'), (' ', '%20'), ('\n', '%0A'), ('\r', '%0D'))
+
+
+def field(value):
+    """A field of a record, - if missing, an escaped %2D if it is -"""
+    if value is None or value == '':
+        return '-'
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    else:
+        value = '{0}'.format(value)
+    if value == '-':
+        return '%2D'
+    for c, escaped in ESCAPES:
+        if c in value:
+            value = value.replace(c, escaped)
+    return value
+
+
+def record(kind, pid, task_id, task_name, retries=None, value=None):
+    """"anan| kind pid task_id task_name retries value", - is missing,
+    the space, the line breaks and % of a field are %-escaped"""
+    return 'anan| {0} {1} {2} {3} {4} {5}'.format(
+        kind, pid, field(task_id), field(task_name), field(retries),
+        field(value))
@@ -49,6 +49,9 @@ fh = logging.handlers.RotatingFileHandler("/var/log/celery/task.log", 'a', maxBy
 formatter = logging.Formatter('[%(asctime)s: -%(levelname)s/%(name)s] %(message)s')
 fh.setFormatter(formatter)
 logger_task.addHandler(fh)
+# ANAN_TRACE=record logs the fixed field records of billiard.anan
+# instead of the messages, celery.utils.anan formats them by it too
+from .anan import RECORD as ANAN_RECORD, record as anan_record
 
 
 if platform.system() == 'Windows':  # pragma: no cover
@@ -303,18 +306,28 @@ def worker(inqueue, outqueue, initializer=None, initargs=(),
                                       task[3][4].get('task'), \
                                       task[3][4].get('retries')
         try:
-            logger_task.info("anan: Woker-{} starts executing task: {{task_id:{}, task_name:{}, retries:{}}}".\
-                             format(pid, task_id, task_name, retries))
+            if ANAN_RECORD:
+                logger_task.info(anan_record('start', pid, task_id, task_name, retries))
+            else:
+                logger_task.info("anan: Woker-{} starts executing task: {{task_id:{}, task_name:{}, retries:{}}}".\
+                                 format(pid, task_id, task_name, retries))
             begin = time.time()
             result = (True, func(*args, **kwds))
             end = time.time()
-            logger_task.info("anan: Worker-{} spends {} seconds executing task: {{task_id:{}, task_name:{}, retries:{}}}".\
-                             format(pid, end - begin, task_id, task_name, retries))
+            if ANAN_RECORD:
+                logger_task.info(anan_record('end', pid, task_id, task_name, retries,
+                                             end - begin))
+            else:
+                logger_task.info("anan: Worker-{} spends {} seconds executing task: {{task_id:{}, task_name:{}, retries:{}}}".\
+                                 format(pid, end - begin, task_id, task_name, retries))
         except Exception:
             result = (False, ExceptionInfo())
         try:
-            logger_task.info("anan: Worker-{} notifies main process done task: {{task_id:{}, task_name:{}, retries:{}}}".\
-                             format(pid, task_id, task_name, retries))
+            if ANAN_RECORD:
+                logger_task.info(anan_record('done', pid, task_id, task_name, retries))
+            else:
+                logger_task.info("anan: Worker-{} notifies main process done task: {{task_id:{}, task_name:{}, retries:{}}}".\
+                                 format(pid, task_id, task_name, retries))
             put((READY, (job, i, result)))
         except Exception, exc:
             _, _, tb = sys.exc_info()
@@ -24,6 +24,7 @@ from . import app_or_default
 from . import routes as _routes
 
 import os, logging
+from celery.utils.anan import RECORD, record
 
 logger_task = logging.getLogger(__name__)
 logger_task.setLevel(logging.DEBUG)
@@ -248,8 +249,11 @@ class TaskProducer(Producer):
             'chord': chord,
         }
 
-        logger_task.info("anan: Consumer-{} starts publishing task: {{task_id:{}, task_name:{}, retries:{}}}"\
-                         .format(os.getpid(), task_id, task_name, body['retries']))
+        if RECORD:
+            logger_task.info(record('publish', task_id, task_name, body['retries']))
+        else:
+            logger_task.info("anan: Consumer-{} starts publishing task: {{task_id:{}, task_name:{}, retries:{}}}"\
+                             .format(os.getpid(), task_id, task_name, body['retries']))
         self.publish(
             body,
             exchange=exchange, routing_key=routing_key,
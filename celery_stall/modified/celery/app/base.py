@@ -37,6 +37,7 @@ from .registry import TaskRegistry
 from .utils import AppPickler, Settings, bugreport, _unpickle_app
 
 import logging
+from celery.utils.anan import RECORD, record
 logger_task = logging.getLogger(__name__)
 logger_task.setLevel(logging.DEBUG)
 fh = logging.handlers.RotatingFileHandler("/var/log/celery/task.log", 'a', maxBytes=52428800, backupCount=50)
@@ -256,8 +257,11 @@ class Celery(object):
                            self.conf.CELERY_MESSAGE_COMPRESSION)
         options = router.route(options, name, args, kwargs)
 
-        logger_task.info("anan: app-{} starts sending task:{{task_id:{}, task_name:{}}} to router:{}".\
-                         format(os.getpid(), task_id, name, router))
+        if RECORD:
+            logger_task.info(record('send', task_id, name))
+        else:
+            logger_task.info("anan: app-{} starts sending task:{{task_id:{}, task_name:{}}} to router:{}".\
+                             format(os.getpid(), task_id, name, router))
         with self.producer_or_acquire(producer) as producer:
             return result_cls(producer.publish_task(
                 name, args, kwargs,
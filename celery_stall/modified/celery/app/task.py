@@ -26,6 +26,7 @@ from .annotations import resolve_all as resolve_all_annotations
 from .registry import _unpickle_task
 
 import os, logging
+from celery.utils.anan import RECORD, record
 logger_task = logging.getLogger(__name__)
 logger_task.setLevel(logging.DEBUG)
 fh = logging.handlers.RotatingFileHandler("/var/log/celery/task.log", 'a', maxBytes=52428800, backupCount=50)
@@ -476,8 +477,11 @@ class Task(object):
         if connection:
             producer = app.amqp.TaskProducer(connection)
         with app.producer_or_acquire(producer) as P:
-            logger_task.info("anan: app-{} starts sending task:{}".\
-                             format(os.getpid(), self.name))
+            if RECORD:
+                logger_task.info(record('send', None, self.name))
+            else:
+                logger_task.info("anan: app-{} starts sending task:{}".\
+                                 format(os.getpid(), self.name))
             task_id = P.publish_task(self.name, args, kwargs,
                                      task_id=task_id,
                                      callbacks=maybe_list(link),
@@ -588,8 +592,11 @@ class Task(object):
 
         # If task was executed eagerly using apply(),
         # then the retry must also be executed eagerly.
-        logger_task.info("anan: Worker-{} starts sending Retry task:{{task_id:{}, task_name:{}, retries:{}}}"\
-                         .format(os.getpid(), request.id, self.name, retries))
+        if RECORD:
+            logger_task.info(record('retry', request.id, self.name, retries))
+        else:
+            logger_task.info("anan: Worker-{} starts sending Retry task:{{task_id:{}, task_name:{}, retries:{}}}"\
+                             .format(os.getpid(), request.id, self.name, retries))
         S.apply().get() if request.is_eager else S.apply_async()
         ret = RetryTaskError(exc=exc, when=eta or countdown)
         if throw:
@@ -16,6 +16,7 @@ from kombu.utils.encoding import safe_repr
 
 from celery.utils import timer2
 from celery.utils.log import get_logger
+from celery.utils.anan import RECORD, record
 
 logger = get_logger('celery.concurrency')
 
@@ -141,8 +142,11 @@ class BasePool(object):
             task_id, task_name, retries = args[4]['id'], args[4]['task'], args[4]['retries']
         else:
             task_id, task_name, retries = None, None, None
-        logger_task.info("anan: Consumer-{}: Apply Task: {{task_id:{}, task_name:{}, retries:{}}}"\
-                         .format(os.getpid(), task_id, task_name, retries))
+        if RECORD:
+            logger_task.info(record('apply', task_id, task_name, retries))
+        else:
+            logger_task.info("anan: Consumer-{}: Apply Task: {{task_id:{}, task_name:{}, retries:{}}}"\
+                             .format(os.getpid(), task_id, task_name, retries))
 
         if self._does_debug:
             logger.debug('TaskPool: Apply %s (args:%s kwargs:%s)',
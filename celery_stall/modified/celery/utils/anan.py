@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""
+    celery.utils.anan
+    ~~~~~~~~~~~~~~~~~
+
+    The fixed field trace records of the patched modules, they are
+    logged instead of the "anan:" messages if the environment variable
+    ANAN_TRACE=record, and split by analysis.py without any parsing.
+
+"""
+from __future__ import absolute_import
+
+import os
+
+# the records are formatted by billiard.anan, billiard.pool can not
+# import celery
+from billiard.anan import RECORD, record as _record  # noqa
+
+
+def record(kind, task_id, task_name, retries=None, value=None):
+    """"anan| kind pid task_id task_name retries value" of this process,
+    see billiard.anan.record"""
+    return _record(kind, os.getpid(), task_id, task_name, retries, value)
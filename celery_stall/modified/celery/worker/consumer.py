@@ -103,6 +103,7 @@ from .control import Panel
 from .heartbeat import Heart
 
 import os
+from celery.utils.anan import RECORD, record
 logger_task = logging.getLogger(__name__)
 logger_task.setLevel(logging.DEBUG)
 fh = logging.handlers.RotatingFileHandler("/var/log/celery/task.log", 'a', maxBytes=52428800, backupCount=50)
@@ -534,8 +535,11 @@ class Consumer(object):
         if task.revoked():
             return
 
-        logger_task.info('anan: Consumer-{} got task from broker: {{task_id:{}, task_name:{}}}'\
-                         .format(os.getpid(), task.id, task.name))
+        if RECORD:
+            logger_task.info(record('got', task.id, task.name))
+        else:
+            logger_task.info('anan: Consumer-{} got task from broker: {{task_id:{}, task_name:{}}}'\
+                             .format(os.getpid(), task.id, task.name))
         if self._does_info:
             info('Got task from broker: %s', task)
 
@@ -50,6 +50,7 @@ _does_info = False
 _does_debug = False
 
 import os
+from celery.utils.anan import RECORD, record
 logger_task = logging.getLogger(__name__)
 logger_task.setLevel(logging.DEBUG)
 fh = logging.handlers.RotatingFileHandler("/var/log/celery/task.log", 'a', maxBytes=52428800, backupCount=50)
@@ -321,8 +322,11 @@ class Request(object):
         if not self.task.acks_late:
             self.acknowledge()
         self.send_event('task-started', pid=pid)
-        logger_task.info('anan: Consumer-{} task-accepted: task: {{task_id:{}, task_name:{}}}'\
-                         .format(os.getpid(), self.id, self.name))
+        if RECORD:
+            logger_task.info(record('accepted', self.id, self.name))
+        else:
+            logger_task.info('anan: Consumer-{} task-accepted: task: {{task_id:{}, task_name:{}}}'\
+                             .format(os.getpid(), self.id, self.name))
         if _does_debug:
             debug('Task accepted: %s[%s] pid:%r', self.name, self.id, pid)
         if self._terminate_on_ack is not None:
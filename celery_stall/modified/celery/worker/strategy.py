@@ -13,6 +13,7 @@ from .job import Request
 import logging
 from celery.utils.log import get_logger
 import os
+from celery.utils.anan import RECORD, record
 logger = get_logger(__name__)
 logger_task = logging.getLogger(__name__)
 logger_task.setLevel(logging.DEBUG)
@@ -34,8 +35,11 @@ def default(task, app, consumer):
                    eventer=eventer, task=task,
                    connection_errors=connection_errors,
                    delivery_info=message.delivery_info)
-        logger_task.info("anan: Consumer-{} Received task: {{task_id:{}, task_name:{}, worker:{}}}"\
-                         .format(os.getpid(), req.id, req.name, req.worker_pid))
+        if RECORD:
+            logger_task.info(record('received', req.id, req.name))
+        else:
+            logger_task.info("anan: Consumer-{} Received task: {{task_id:{}, task_name:{}, worker:{}}}"\
+                             .format(os.getpid(), req.id, req.name, req.worker_pid))
         logger.info("Received task: {}".format(req))
         handle(Req(body, on_ack=ack, app=app, hostname=hostname,
                    eventer=eventer, task=task,
@@ -17,6 +17,9 @@ try:
     from wand.image import Image
 except ImportError:
     pass
+# sinks.py links to the one of celery_stall/bin, the report sinks are
+# shared with analysis.py
+from sinks import SINKS, load_report, report_type
 
 
 Commands = ("analyze", "read", "profiling")
@@ -26,6 +29,19 @@ USAGE = """
 Commands:
 """ + '\n'.join(["%10s: " % x for x in Commands])
 
+# the bytes of the memory units of top, a number without a unit is KiB
+TOP_UNITS = {'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30, 't': 1 << 40, 'p': 1 << 50}
+
+
+def top_bytes(value):
+    """
+    The bytes of a VIRT, RES or SHR column of top, e.g. 1.2g, 512m or 2048
+    """
+    unit = TOP_UNITS.get(value[-1:].lower())
+    if unit is None:
+        return int(float(value) * TOP_UNITS['k'])
+    return int(float(value[:-1]) * unit)
+
 def timeit(f, *args, **kwargs):
     @wraps(f)
     def deco(*args, **kwargs):
@@ -108,12 +124,20 @@ class TopLogAnalyzer(object):
     @log: the top command output by using top -p [pid1, pid2, ...] -b > top.log
     @pids_num: the number of processes to monitor
     @user: the user of the pids
+    @type: the report type[csv|parquet|feather|npy], parquet and feather
+           need pyarrow, npy is used if it is not installed
 
     """
     csv_header = ('timestamp', 'load_1', 'load_5', 'load_15',
                   'pid', 'virt', 'res', 'shr', 'cpu', 'mem'
                   )
-    def __init__(self, log=None, pids=0, user='ubuntu', *args, **kwargs):
+    # the types of the columns of a columnar report, virt, res and shr
+    # are in bytes
+    column_types = {'timestamp': 'S8', 'load_1': 'f8', 'load_5': 'f8',
+                    'load_15': 'f8', 'pid': 'i8', 'virt': 'i8', 'res': 'i8',
+                    'shr': 'i8', 'cpu': 'f8', 'mem': 'f8'}
+
+    def __init__(self, log=None, pids=0, user='ubuntu', type='csv', *args, **kwargs):
         super(TopLogAnalyzer, self).__init__()
         self._log = log
         self._report_dir = 'reports'
@@ -121,9 +145,10 @@ class TopLogAnalyzer(object):
         self._user = user
         self._args = args
         self._kwargs = kwargs
+        self._type = report_type(type)
         self._csv = log.split('.')[0] + \
-            "_{}.csv".format(time.strftime('%y%m%d%H%M%S')) if log \
-            else "top_{}.csv".format(time.strftime('%y%m%d%H%M%S'))
+            "_{}.{}".format(time.strftime('%y%m%d%H%M%S'), self._type) if log \
+            else "top_{}.{}".format(time.strftime('%y%m%d%H%M%S'), self._type)
         self._csv_writer = self._build_csv_writer() if kwargs['cmd'] == 'analyze' else None
 
 
@@ -134,26 +159,12 @@ class TopLogAnalyzer(object):
         self._fd.close()
 
     def _build_csv_writer(self):
-        def _build_header():
-            if not os.path.exists(self._report_dir):
-                os.mkdir(self._report_dir)
-            self._csv = os.path.join(self._report_dir, self._csv)
-            try:
-                with open(self._csv, 'wb') as f:
-                    w = csv.DictWriter(f, self.csv_header)
-                    w.writeheader()
-            except IOError:
-                raise
-        try:
-            _build_header()
-        except:
-            raise
-        try:
-            self._fd = open(self._csv, 'a')
-            w = csv.DictWriter(self._fd, self.csv_header)
-        except IOError:
-            raise
-        return w
+        if not os.path.exists(self._report_dir):
+            os.mkdir(self._report_dir)
+        self._csv = os.path.join(self._report_dir, self._csv)
+        self._fd = SINKS[self._type](self._csv, self.csv_header,
+                                     self.column_types)
+        return self._fd
 
     def _collect_data(self):
 
@@ -165,11 +176,11 @@ class TopLogAnalyzer(object):
 
         def _collect_stats(line):
             words = [x for x in line.rstrip('\n').rstrip(' ').lstrip(' ').split(' ') if x != '']
-            # pid, virt, res, shr, %cpu, %mem
+            # pid, virt, res, shr(in bytes), %cpu, %mem
             pid = words[0]
-            virt = words[4].rstrip('m')
-            res = words[5].rstrip('m')
-            shr = words[6]
+            virt = top_bytes(words[4])
+            res = top_bytes(words[5])
+            shr = top_bytes(words[6])
             cpu = words[8]
             mem = words[9]
             return [pid, virt, res, shr, cpu, mem]
@@ -188,10 +199,9 @@ class TopLogAnalyzer(object):
                         pid_stat = _collect_stats(l)
                         _stats += pid_stat
                         data = dict(zip(self.csv_header, _stats))
-                        self._csv_writer.writerow(data)
+                        self._csv_writer.write(data)
                         # Drain out pid_stat for next pid
-                        for x in pid_stat:
-                            _stats.remove(x)
+                        del _stats[-len(pid_stat):]
         except IOError:
             raise
 
@@ -204,12 +214,12 @@ class TopLogAnalyzer(object):
         print("\nreading {}...\n".format(csv_report))
         #path = os.path.join(os.getcwd(), csv_report)
         path = os.path.join(os.curdir, csv_report)
-        df = pd.read_csv(path)
+        df = load_report(path)
         print 75*"="
         if idx == 'index':
-            print df.sort(ascending=asc).head(num)
+            print df.sort_index(ascending=asc).head(num)
         else:
-            print df.sort(idx, ascending=asc).head(num)
+            print df.sort_values(idx, ascending=asc).head(num)
         print 75*"="
         print "%40s"%"Statistic Info"
         print "%45s"%(12*"==")
@@ -241,6 +251,8 @@ def main():
                       help='The test loops count')
     parser.add_option('-d', '--dir', type="string", dest="dir", default='1000_pics',
                       help='The directory contains test files')
+    parser.add_option('-f', '--format', type="string", dest="type", default='csv',
+                      help='The report type[csv|parquet|feather|npy]')
     parser.add_option('-i', '--index', type='string', dest='idx', default='virt',
                       help='display by which index[cpu|mem|load_1~load_5|virt|res|shr]')
     parser.add_option('-l', '--log', type="string", dest="log", default='top.log',
@@ -248,7 +260,7 @@ def main():
     parser.add_option('-n', '--number', type='int', dest="num",
                       help='The number of pids to monitor or number of records to display')
     parser.add_option('-r', '--report', type='string', dest="report", default='top.csv',
-                      help='The csv report to read')
+                      help='The report to read[.csv|.parquet|.feather|.npy]')
     parser.add_option('-u', '--user', type="string", dest="user", default='ubuntu',
                       help='The user who runs the pids')
     parser.add_option('-v', '--verbose', action='store_false', dest='verbose',
@@ -267,7 +279,7 @@ def main():
         return 1
 
     if cmd == 'analyze':
-        parameters = (options.log, options.num, options.user)
+        parameters = (options.log, options.num, options.user, options.type)
         with TopLogAnalyzer(*parameters, cmd='analyze') as analyzer:
             analyzer.analyze()
     elif cmd == 'read':
@@ -0,0 +1 @@
+../celery_stall/bin/sinks.py
\ No newline at end of file